@@ -0,0 +1,307 @@
+# Нагрузочный тест обработчиков бота без доступа к сети.
+#
+# Синтетические обновления (/start, ГДЗ, /search с листанием, /translate, сканирование фото)
+# прогоняются через настоящий Dispatcher из bot.py и очередь обновлений из data/updates.py.
+# Telegram Bot API, Google, сайт ГДЗ и переводчик заменены локальными заглушками с настраиваемой задержкой,
+# база данных — временной копией data/database/bot.db.
+#
+# Запуск из корня репозитория:
+#     python -m benchmarks.bench_handlers --users 50 --rounds 3
+#     python -m benchmarks.bench_handlers --users 50 --burst 5
+#     python -m benchmarks.bench_handlers --users 20 --album 6
+#     python -m benchmarks.bench_handlers --real-ocr --photos data/photos
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data.config as config  # noqa: E402
+
+SEARCH_QUERIES = ["теорема пифагора", "закон ома", "причастный оборот", "формула дискриминанта",
+                  "present perfect", "великая отечественная война"]
+TRANSLATE_TEXTS = ["Мама мыла раму. Папа читал газету.", "Сегодня хорошая погода.",
+                   "Я люблю учиться. Домашнее задание готово!"]
+TASKS = ["1", "2", "3", "5", "10", "12.1", "25"]
+
+
+# Заглушка Telegram Bot API: отвечает правдоподобными объектами после задержки
+class FakeTelegram:
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = Counter()
+        self._ids = itertools.count(100000)
+
+    def _message(self, chat_id, photo=False):
+        message = {"message_id": next(self._ids), "date": int(time.time()),
+                   "chat": {"id": int(chat_id), "type": "private"}}
+        if photo:
+            file_id = f"file{message['message_id']}"
+            message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 800, "height": 600}]
+        else:
+            message["text"] = "ok"
+        return message
+
+    async def make_request(self, session, server, token, method, data=None, files=None, **kwargs):
+        self.calls[method] += 1
+        await asyncio.sleep(self.latency)
+        data = data or {}
+        if method == "sendMediaGroup":
+            return [self._message(data["chat_id"], photo=True) for _ in json.loads(data["media"])]
+        if method == "sendPhoto":
+            return self._message(data["chat_id"], photo=True)
+        if method in ("sendMessage", "editMessageText"):
+            return self._message(data["chat_id"])
+        if method == "getFile":
+            return {"file_id": data["file_id"], "file_unique_id": data["file_id"], "file_path": "photos/sample.jpg"}
+        return True
+
+
+def _fake_google(latency):
+    def search(query):
+        time.sleep(latency)
+        return [f"https://example.org/{abs(hash(query)) % 1000}/{i}" for i in range(3)]
+    return search
+
+
+def _fake_gdz(latency):
+    async def fetch_page(url):
+        await asyncio.sleep(latency)
+        images = "".join(f'<img src="//gdz.example/tasks/{abs(hash(url)) % 10000}-{i}.png">' for i in range(3))
+        return f"<html><body><img src='//gdz.example/logo.png'>{images}</body></html>"
+    return fetch_page
+
+
+def _fake_ocr(latency):
+    def extract_text(data):
+        time.sleep(latency)
+        return f"распознано {len(data)} байт"
+    return extract_text
+
+
+# Пакет из нескольких страниц распознаётся быстрее, чем те же страницы по одной
+def _fake_ocr_batch(latency):
+    def extract_texts(pages):
+        time.sleep(latency * (1 + 0.5 * (len(pages) - 1)))
+        return [f"распознано {len(data)} байт" for data in pages]
+    return extract_texts
+
+
+# Построение синтетических обновлений Telegram
+class Updates:
+    def __init__(self):
+        self._ids = itertools.count(1)
+
+    def _user(self, user_id):
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+    def message(self, user_id, text=None, photo=None, media_group_id=None):
+        update_id = next(self._ids)
+        message = {"message_id": update_id, "date": int(time.time()), "from": self._user(user_id),
+                   "chat": {"id": user_id, "type": "private"}}
+        if text is not None:
+            message["text"] = text
+            if text.startswith("/"):
+                command = text.split()[0]
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(command)}]
+        if photo is not None:
+            message["photo"] = [{"file_id": photo, "file_unique_id": photo, "width": 800, "height": 600}]
+        if media_group_id is not None:
+            message["media_group_id"] = media_group_id
+        return {"update_id": update_id, "message": message}
+
+    def callback(self, user_id, data):
+        update_id = next(self._ids)
+        message = {"message_id": update_id, "date": int(time.time()), "text": "...",
+                   "chat": {"id": user_id, "type": "private"}}
+        return {"update_id": update_id,
+                "callback_query": {"id": str(update_id), "from": self._user(user_id), "chat_instance": "1",
+                                   "message": message, "data": data}}
+
+
+# Сценарий одного пользователя за один раунд.
+# Шаг — обновления, которые пользователь отправляет подряд, не дожидаясь ответа;
+# следующий шаг отправляется только после обработки предыдущего.
+def scenario(updates, user_id, round_number, rng, with_photos, burst, album):
+    steps = [[updates.message(user_id, "/start")], [updates.message(user_id, "/help")]]
+
+    steps += [[updates.message(user_id, "/gdz")],
+              [updates.callback(user_id, "subject:Алгебра:10")],
+              [updates.callback(user_id, "textbook:10:1")],
+              [updates.message(user_id, rng.choice(TASKS)) for _ in range(burst)]]
+
+    from data.pagination import query_handle
+    from data.search import normalize_query
+
+    query = rng.choice(SEARCH_QUERIES)
+    steps.append([updates.message(user_id, "/search " + query)])
+    steps.append([updates.callback(user_id, f"forward_0_{query_handle(normalize_query(query))}_{user_id}")])
+
+    steps += [[updates.message(user_id, "/translate")],
+              [updates.callback(user_id, "source_language:Русский")],
+              [updates.callback(user_id, "target_language:Английский")],
+              [updates.message(user_id, rng.choice(TRANSLATE_TEXTS))]]
+
+    if with_photos:
+        steps += [[updates.message(user_id, "/scan_text")],
+                  [updates.message(user_id, photo=f"photo{round_number}-{i}") for i in range(burst)]]
+        if album > 1:
+            group = f"{user_id}-{round_number}"
+            steps += [[updates.message(user_id, "/scan_text")],
+                      [updates.message(user_id, photo=f"album{round_number}-{i}", media_group_id=group)
+                       for i in range(album)]]
+    return steps
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def run(args):
+    from aiogram import types
+    from aiogram.bot import api
+    from aiogram.dispatcher.handler import current_handler
+    from aiogram.dispatcher.middlewares import BaseMiddleware
+
+    import bot as bot_module
+    import data.functions
+    import data.gdz
+    from data.database.connection import db
+    from data.translation import StubBackend, translation_engine
+    from data.updates import UpdateQueue
+    from data.workers import ocr_workers, shutdown_workers
+
+    db.path = args.database
+    telegram = FakeTelegram(args.telegram_latency)
+    api.make_request = telegram.make_request
+    data.functions._google_query = _fake_google(args.google_latency)
+    data.gdz.fetch_page = _fake_gdz(args.gdz_latency)
+    translation_engine.backend = StubBackend(args.translate_latency)
+
+    photos = [open(os.path.join(args.photos, name), "rb").read()
+              for name in sorted(os.listdir(args.photos)) if name.lower().endswith((".jpg", ".jpeg", ".png"))]
+    if not args.real_ocr:
+        data.functions.extract_text = _fake_ocr(args.ocr_latency)
+        data.functions.extract_texts = _fake_ocr_batch(args.ocr_latency)
+        ocr_workers._executor_factory = lambda: ThreadPoolExecutor(max_workers=config.OCR_PROCESSES)
+
+    async def download_file(file_path, *a, **kwargs):
+        return io.BytesIO(random.choice(photos))
+    bot_module.bot.download_file = download_file
+
+    latencies = defaultdict(list)
+    processed = {}
+
+    class BenchMiddleware(BaseMiddleware):
+        async def trigger(self, action, middleware_args):
+            data = middleware_args[-1]
+            if action.startswith("process_"):
+                data["_bench"] = (current_handler.get().__name__, time.perf_counter())
+            elif action.startswith("post_process_"):
+                if "_bench" in data:
+                    name, started = data.pop("_bench")
+                    latencies[name].append(time.perf_counter() - started)
+                processed.pop(types.Update.get_current().update_id).set()
+
+    dp = bot_module.dp
+    dp.middleware.setup(BenchMiddleware())
+    await bot_module.on_startup(dp)
+    if args.real_ocr:
+        await bot_module.warm_up()
+
+    rng = random.Random(args.seed)
+    updates = Updates()
+    first_user = 10 ** 9
+    streams = []
+    for user_id in range(first_user, first_user + args.users):
+        steps = [[updates.message(user_id, "10")]]
+        for round_number in range(args.rounds):
+            steps += scenario(updates, user_id, round_number, rng, bool(photos), args.burst, args.album)
+        streams.append(steps)
+    total = sum(len(step) for steps in streams for step in steps)
+
+    async def user_session(steps):
+        for step in steps:
+            events = []
+            for update in step:
+                events.append(processed.setdefault(update["update_id"], asyncio.Event()))
+                await queue.put(types.Update(**update))
+            await asyncio.gather(*(event.wait() for event in events))
+
+    queue = UpdateQueue(dp, workers=args.workers, maxsize=args.queue_size)
+    queue.start()
+    tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(user_session(steps) for steps in streams))
+    await queue.stop(timeout=None)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    await bot_module.on_shutdown(dp)
+    await dp.storage.close()
+    await (await dp.bot.get_session()).close()
+    shutdown_workers()
+
+    print(f"Обновлений: {total}, время: {elapsed:.2f} с, {total / elapsed:.1f} обновлений/с")
+    print(f"Пик памяти Python: {peak / 2 ** 20:.1f} МБ, "
+          f"max RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} МБ")
+    print(f"\n{'обработчик':<28}{'вызовов':>9}{'p50, мс':>10}{'p99, мс':>10}")
+    for name, values in sorted(latencies.items()):
+        print(f"{name:<28}{len(values):>9}{percentile(values, 0.5) * 1000:>10.1f}"
+              f"{percentile(values, 0.99) * 1000:>10.1f}")
+    print("\nВызовы Bot API:", dict(telegram.calls))
+    print("Допуск задач:", bot_module.admission.stats())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест обработчиков бота без сети")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=config.UPDATE_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=config.UPDATE_QUEUE_SIZE)
+    parser.add_argument("--telegram-latency", type=float, default=0.03)
+    parser.add_argument("--google-latency", type=float, default=0.5)
+    parser.add_argument("--gdz-latency", type=float, default=0.3)
+    parser.add_argument("--translate-latency", type=float, default=0.2)
+    parser.add_argument("--ocr-latency", type=float, default=1.0)
+    parser.add_argument("--real-ocr", action="store_true", help="распознавать фото настоящим easyocr")
+    parser.add_argument("--photos", default="data/photos", help="папка с фото для сканирования")
+    parser.add_argument("--rate-limits", action="store_true", help="соблюдать лимиты Telegram на отправку")
+    parser.add_argument("--burst", type=int, default=1,
+                        help="сколько фото и номеров заданий пользователь отправляет подряд, не дожидаясь ответа")
+    parser.add_argument("--album", type=int, default=0, help="сколько фото в альбоме для сканирования (0 — без альбомов)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    # Настройки, которые должны быть заданы до импорта bot.py
+    config.BOT_TOKEN = "123456:benchmark"  # запросы к Bot API всё равно не уходят в сеть
+    config.TRANSLATE_BACKEND = "stub"
+    config.METRICS_PORT = 0
+    config.CATALOGUE_RELOAD_INTERVAL = 0
+    config.OCR_PRELOAD = args.real_ocr
+    config.WARM_UP_BACKENDS = False
+    if not args.rate_limits:
+        config.RATE_GLOBAL = config.RATE_CHAT = config.RATE_CHAT_BURST = 10 ** 6
+
+    with tempfile.TemporaryDirectory() as directory:
+        args.database = os.path.join(directory, "bot.db")
+        shutil.copy(config.DB_PATH, args.database)
+        asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -2,29 +2,64 @@ import logging
 import os
 import asyncio
 
+from data import backends  # первым: отсюда отсчитывается время импорта остальных модулей
+
+import aiohttp
 import aiogram.utils.exceptions
-from aiogram import Bot, Dispatcher, types, executor
+from aiogram import Dispatcher, types
 from aiogram.contrib.middlewares.logging import LoggingMiddleware
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters import Text
-from aiogram.contrib.fsm_storage.memory import MemoryStorage
 
-from data.config import BOT_TOKEN
-from data.database.base import (add_user, update_user_class, check_user, check_user_class,
-                                check_google_query, add_google_query, delete_google_query,
-                                check_textbooks, check_textbook_url)
-from data.functions import text_extract, translate_text, SUPPORTED_LANGUAGES, google_query, get_images_url
+from data.config import (BOT_TOKEN, OCR_PRELOAD, OCR_DEBUG_CAPTURE, OCR_BATCH_PAGES, ADMIN_IDS, CATALOGUE_RELOAD_INTERVAL,
+                         FSM_STATE_TTL, FSM_EXPIRE_INTERVAL, METRICS_PORT, TRANSLATE_BACKEND, WARM_UP_BACKENDS)
+from data.database.connection import db
+from data.database.catalogue import catalogue
+from data.database.fsm_storage import SQLiteStorage
+from data.database.migrations import migrate
+from data.database.base import (user_cache, add_user, update_user_class, check_user, check_user_class,
+                                check_google_query, add_google_query, delete_google_query)
+from data.functions import text_extract, text_extract_batch, translate_text, SUPPORTED_LANGUAGES, get_images_url
+from data.gdz import task_url, images_cache, prefetcher, close_session
+from data.translation import translation_engine
+from data.media import send_images, file_ids
+from data.search import cached_search, normalize_query, search_cache, expire_results
+from data.pagination import register_results, get_results, query_handle, result_handles
+from data.metrics import MetricsMiddleware, register_stats, start_metrics_server
+from data.updates import start
+from data.sender import ThrottledBot
+from data.admission import admission
+from data.albums import albums
+from data.workers import JobCancelled, cancel_user_jobs, warm_up_workers, shutdown_workers, worker_pools
 from data.states_groups.classes import ScanText, TranslationStates, GDZStates
 from data.keyboards.main_menu import main_menu_kb
 from data.keyboards.classes import classes_kb
 from data.keyboards.subjects import class_9_subjects_kb, class_10_subjects_kb, class_11_subjects_kb
+from data.keyboards.pagination import build_pagination_kb
 
 logging.basicConfig(level=logging.INFO)
 
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher(bot, storage=MemoryStorage())
+bot = ThrottledBot(token=BOT_TOKEN)
+storage = SQLiteStorage(db, ttl=FSM_STATE_TTL)
+dp = Dispatcher(bot, storage=storage)
 dp.middleware.setup(LoggingMiddleware())
+dp.middleware.setup(MetricsMiddleware())
+
+register_stats("user_cache", user_cache.stats)
+register_stats("search_cache", search_cache.stats)
+register_stats("gdz_cache", images_cache.stats)
+register_stats("gdz_prefetch", prefetcher.stats)
+register_stats("translation_cache", translation_engine.stats)
+register_stats("file_id_cache", file_ids.stats)
+register_stats("pagination", result_handles.stats)
+register_stats("sender", bot.stats)
+register_stats("admission", admission.stats)
+register_stats("albums", albums.stats)
+register_stats("backend_import_seconds", backends.stats)
+for pool in worker_pools:
+    register_stats(f"{pool.name}_workers", pool.stats)
+backends.mark("imports")
 
 
 # Обработчик команды /start
@@ -93,25 +128,70 @@ async def change_class(message: types.Message):
 async def scan_text_button(message: types.Message):
     keyboard = types.ReplyKeyboardMarkup(resize_keyboard=True)
     keyboard.add(types.KeyboardButton(text="/cancel"))
-    await message.reply("Пришли мне фото, чтобы я мог его отсканировать.", reply_markup=keyboard)
+    await message.reply("Пришли мне фото или альбом из нескольких фото, чтобы я мог их отсканировать.",
+                        reply_markup=keyboard)
     await ScanText.waiting_for_photo.set()
 
 
-# Обработчик сканирования фото
+# Состояние чата (FSM) и его данные: пока задача выполняется, чат отпущен и пользователь может начать другое действие
+async def state_snapshot(state: FSMContext):
+    return await state.get_state(), await state.get_data()
+
+
+# Завершение действия после задачи, только если за время задачи пользователь не начал новое
+async def finish_if_unchanged(state: FSMContext, snapshot):
+    if await state_snapshot(state) == snapshot:
+        await state.finish()
+
+
+# Загрузка фото из сообщения
+async def download_photo(message: types.Message):
+    file_info = await bot.get_file(message.photo[-1].file_id)
+    file = await bot.download_file(file_info.file_path)
+
+    if OCR_DEBUG_CAPTURE:
+        file_name = os.path.join("data/photos", f"{message.from_user.id}_{message.message_id}.jpg")
+        with open(file_name, 'wb') as new_file:
+            new_file.write(file.getvalue())
+    return file.getvalue()
+
+
+# Распознавание альбома пачками по OCR_BATCH_PAGES страниц: пачки отправляются в пул по одной,
+# чтобы длинный альбом не занимал все процессы OCR сразу; текст пачки отправляется, как только она готова
+async def scan_album(chat_id, pages):
+    for start in range(0, len(pages), OCR_BATCH_PAGES):
+        texts = await text_extract_batch(pages[start:start + OCR_BATCH_PAGES])
+        for number, text in enumerate(texts, start + 1):
+            await bot.send_message(chat_id, f"Страница {number} из {len(pages)}:\n"
+                                            f"{text or 'Не удалось найти текст на фото.'}",
+                                   reply_markup=main_menu_kb)
+
+
+# Обработчик сканирования фото (одного или альбома)
 @dp.message_handler(content_types=types.ContentType.PHOTO, state=ScanText.waiting_for_photo)
 async def handle_photo(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
-    photo = message.photo[-1]
-    file_info = await bot.get_file(photo.file_id)
-    file_path = file_info.file_path
-    file = await bot.download_file(file_path)
-    file_name = os.path.join("data/photos", f"{user_id}.jpg")
-
-    with open(file_name, 'wb') as new_file:
-        new_file.write(file.getvalue())
-    text = await text_extract(file_name)
-    await message.answer(text, reply_markup=main_menu_kb)
-    await state.finish()
+    if message.media_group_id is None:
+        messages = [message]
+    else:
+        messages = await albums.collect(message)
+        if messages is None:
+            return  # Фото добавлено в альбом, весь альбом распознает обработчик первого фото
+    pages = await asyncio.gather(*(download_photo(item) for item in messages))
+
+    snapshot = await state_snapshot(state)
+    try:
+        if len(pages) > 1:
+            await admission.run("ocr", message.media_group_id, user_id, scan_album, message.chat.id, pages)
+        else:
+            text = await admission.run("ocr", message.photo[-1].file_unique_id, user_id, text_extract, pages[0])
+            await message.answer(text or "Не удалось найти текст на фото.", reply_markup=main_menu_kb)
+    except JobCancelled:
+        return
+    except asyncio.TimeoutError:
+        await message.answer("Не удалось распознать текст за отведённое время. Попробуйте ещё раз.",
+                             reply_markup=main_menu_kb)
+    await finish_if_unchanged(state, snapshot)
 
 
 # Обработчик команды /translate
@@ -168,22 +248,28 @@ async def process_translation(message: types.Message, state: FSMContext):
         await message.reply("Что-то пошло не так. Пожалуйста, попробуйте ещё раз.")
         return
 
-    text = await translate_text(message.text, source_language, target_language)
+    snapshot = await state_snapshot(state)
+    try:
+        text = await admission.run("translate", (message.text, source_language, target_language),
+                                   message.from_user.id, translate_text, message.text, source_language,
+                                   target_language)
+    except JobCancelled:
+        return
+    except asyncio.TimeoutError:
+        await message.reply("Переводчик не ответил вовремя. Попробуйте ещё раз.")
+        return
 
     await bot.send_message(chat_id=message.chat.id,
                            text=text)
-    await state.finish()
+    await finish_if_unchanged(state, snapshot)
 
 
 # Обработчик кнопки добавления бота в беседу
 @dp.message_handler(commands=['add_bot_to'])
 @dp.message_handler(lambda message: message.text == "Добавить бота в беседу 👥")
 async def add_bot_to(message: types.Message):
-    try:
-        await bot.delete_message(chat_id=message.chat.id, message_id=message.message_id - 1)
-        await bot.delete_message(chat_id=message.chat.id, message_id=message.message_id - 2)
-    except aiogram.utils.exceptions.MessageCantBeDeleted:
-        pass
+    bot.delete_later(message.chat.id, message.message_id - 1)
+    bot.delete_later(message.chat.id, message.message_id - 2)
     keyboard = types.InlineKeyboardMarkup(row_width=1)
     keyboard.add(types.InlineKeyboardButton(text="Выбрать беседу 👥", url="https://t.me/xordeo_bot?startgroup=start"))
     await message.answer("Чтобы добавить бота в беседу, нажмите на кнопку ниже ⬇", reply_markup=keyboard)
@@ -199,87 +285,92 @@ async def google_question(message: types.Message):
                          "Важно: перед использованием других команд, пропишите /cancel")
 
 
+# У пользователя хранится только его запрос, сами ссылки берутся из общего кэша поиска
 async def search_links(user_id, query):
     user_query = await check_google_query(user_id)
+    if user_query is None:
+        return []
     if user_query[0] is None:
-        get_google_query = await google_query(query)
-        user_google_query = ", ".join(get_google_query)
-        await add_google_query(user_id, user_google_query)
-        user_google_query = await check_google_query(user_id)
-        return user_google_query[0].split(", ")
+        links = await cached_search(query, user_id=user_id)
+        await add_google_query(user_id, normalize_query(query))
+        return links
     else:
-        user_google_query = await check_google_query(user_id)
-        return user_google_query[0].split(", ")
+        return await cached_search(user_query[0], user_id=user_id)
+
+
+def link_message_text(links, index):
+    return (f"Ссылка на возможный ответ:\n"
+            f"{links[index]}\n"
+            f"Перед использованием другой команды, пропишите /cancel")
 
 
-async def send_link(chat_id, index, links, user_id, reply_to_message_id):
+async def send_link(chat_id, index, query, links, user_id, reply_to_message_id):
     if not links:
         return  # Если список ссылок пустой, просто выходим
 
     if not 0 <= index < len(links):
         return  # Если индекс находится вне допустимого диапазона, просто выходим
 
-    keyboard = types.InlineKeyboardMarkup(row_width=2)
-    buttons = []
-    if index > 0:
-        buttons.append(types.InlineKeyboardButton(
-            text="⬅ Назад", callback_data=f"backward_{index}_{user_id}_{reply_to_message_id}"))
-    if index < len(links) - 1:
-        buttons.append(types.InlineKeyboardButton(
-            text="Вперёд ➡", callback_data=f"forward_{index}_{user_id}_{reply_to_message_id}"))
-    keyboard.add(*buttons)
-
-    # Отправляем новое сообщение или редактируем существующее, если оно уже было отправлено
-    message_text = (f"Ссылка на возможный ответ:\n"
-                    f"{links[index]}\n"
-                    f"Перед использованием другой команды, пропишите /cancel")
-    if hasattr(send_link, 'last_message'):
-        try:
-            await bot.edit_message_text(message_text, chat_id, send_link.last_message.message_id, reply_markup=keyboard)
-        except aiogram.utils.exceptions.MessageToEditNotFound:
-            send_link.last_message = await bot.send_message(chat_id, message_text, reply_markup=keyboard,
-                                                            reply_to_message_id=reply_to_message_id)
-    else:
-        send_link.last_message = await bot.send_message(chat_id, message_text, reply_markup=keyboard,
-                                                        reply_to_message_id=reply_to_message_id)
+    # Каждый поиск получает своё сообщение, дальше листание редактирует именно его
+    handle = register_results(query, links)
+    keyboard = build_pagination_kb(handle, index, len(links), user_id)
+    await bot.send_message(chat_id, link_message_text(links, index), reply_markup=keyboard,
+                           reply_to_message_id=reply_to_message_id)
 
 
 @dp.message_handler(commands=['search'])
 async def search_handler(message: types.Message):
-    try:
-        await bot.delete_message(chat_id=message.chat.id, message_id=message.message_id - 1)
-    except aiogram.utils.exceptions.MessageCantBeDeleted:
-        pass
-    try:
-        await bot.delete_message(chat_id=message.chat.id, message_id=message.message_id - 2)
-    except aiogram.utils.exceptions.MessageCantBeDeleted:
-        pass
+    bot.delete_later(message.chat.id, message.message_id - 1)
+    bot.delete_later(message.chat.id, message.message_id - 2)
     user_id = message.from_user.id
     await delete_google_query(user_id)
     query = message.get_args()
-    links = await search_links(user_id, query)
+    try:
+        links = await admission.run("search", normalize_query(query), user_id, search_links, user_id, query)
+    except JobCancelled:
+        return
+    except asyncio.TimeoutError:
+        await message.reply("Google не ответил вовремя. Попробуйте ещё раз.")
+        return
     if links:
-        await send_link(message.chat.id, 0, links, user_id, message.message_id)
+        await send_link(message.chat.id, 0, normalize_query(query), links, user_id, message.message_id)
 
 
 @dp.callback_query_handler(lambda c: c.data.startswith(('forward', 'backward')))
 async def callback_handler(callback_query: types.CallbackQuery):
-    index = int(callback_query.data.split('_')[1])  # Получаем индекс из данных обратного вызова
-    links = await search_links(int(callback_query.data.split('_')[2]), "")
-    await bot.answer_callback_query(callback_query.id)
+    _, index, handle, user_id = callback_query.data.split('_')  # Индекс, результаты поиска и их владелец
+    index = int(index)
+    links = get_results(handle)
+    if links is None:
+        # Результаты вытеснены из памяти — восстанавливаем их по сохранённому запросу владельца,
+        # только если это тот же запрос, по которому отправлено сообщение
+        user_query = await check_google_query(int(user_id))
+        if user_query is not None and user_query[0] is not None and query_handle(user_query[0]) == handle:
+            try:
+                links = await cached_search(user_query[0], user_id=int(user_id))
+            except (JobCancelled, asyncio.TimeoutError):
+                links = None
+            if links:
+                register_results(user_query[0], links)
     if not links:
-        return  # Если список ссылок пустой, просто выходим
-
-    if not 0 <= index < len(links):
-        return  # Если индекс находится вне допустимого диапазона, просто выходим
+        await bot.answer_callback_query(callback_query.id, "Результаты поиска устарели. Повторите /search.")
+        return
+    await bot.answer_callback_query(callback_query.id)
 
     if callback_query.data.startswith('forward'):
         index += 1
     elif callback_query.data.startswith('backward'):
         index -= 1
 
-    await send_link(callback_query.message.chat.id, index, links, int(callback_query.data.split('_')[2]),
-                    int(callback_query.data.split('_')[3]))
+    if not 0 <= index < len(links):
+        return  # Если индекс находится вне допустимого диапазона, просто выходим
+
+    keyboard = build_pagination_kb(handle, index, len(links), user_id)
+    try:
+        await bot.edit_message_text(link_message_text(links, index), callback_query.message.chat.id,
+                                    callback_query.message.message_id, reply_markup=keyboard)
+    except aiogram.utils.exceptions.MessageNotModified:
+        pass
 
 
 @dp.message_handler(commands=['gdz'])
@@ -298,18 +389,22 @@ async def choose_subject(message: types.Message):
 async def choose_textbook(callback_query: types.CallbackQuery):
     subject = callback_query.data.split(':')[1]
     user_class = callback_query.data.split(':')[2]
-    textbooks = await check_textbooks(user_class, subject)
-    keyboard = types.InlineKeyboardMarkup()
-    for textbook in textbooks:
-        keyboard.add(types.InlineKeyboardButton(textbook[0], callback_data=f'textbook:{textbook[0].rstrip()}'))
+    keyboard = catalogue.textbooks_kb(user_class, subject)
     await bot.edit_message_text("Выберите учебник:", callback_query.message.chat.id,
                                 callback_query.message.message_id, reply_markup=keyboard)
 
 
 @dp.callback_query_handler(lambda c: c.data.startswith('textbook:'))
 async def choose_task(callback_query: types.CallbackQuery, state: FSMContext):
-    textbook = callback_query.data.split(':')[1]
-    await state.update_data(textbook=textbook)
+    parts = callback_query.data.split(':')
+    if len(parts) != 3 or not (parts[1].isdigit() and parts[2].isdigit()):
+        # Кнопка из старой клавиатуры (textbook:<название>), отправленной до смены формата
+        await bot.answer_callback_query(callback_query.id)
+        await bot.edit_message_text("Этот список учебников устарел. Откройте ГДЗ заново: /gdz",
+                                    callback_query.message.chat.id, callback_query.message.message_id)
+        return
+    user_class, book_id = parts[1:3]
+    await state.update_data(textbook_class=int(user_class), textbook_id=int(book_id))
     await bot.edit_message_text("Введите номер задания:", callback_query.message.chat.id,
                                 callback_query.message.message_id)
     await GDZStates.choosing_task.set()
@@ -319,34 +414,87 @@ async def choose_task(callback_query: types.CallbackQuery, state: FSMContext):
 @dp.message_handler(state=GDZStates.choosing_task)
 async def choosing_task(message: types.Message, state: FSMContext):
     data = await state.get_data()
-    textbook = data.get('textbook')
-    url = await check_textbook_url(textbook.split()[0], textbook)
-    message_text = message.text
-    if "." in message_text:
-        message_text = message_text.replace(".", "-")
-    textbook_url = url[0] + message_text + url[1]
-    images = await get_images_url(textbook_url)
-    if images:
-        for image in images:
-            await bot.send_message(chat_id=message.chat.id,
-                                   text=image)
+    book = catalogue.book(data.get('textbook_class'), data.get('textbook_id'))
+    if book is None:
+        await bot.send_message(chat_id=message.chat.id,
+                               text="Учебник не найден. Откройте ГДЗ заново.")
         await state.finish()
+        return
+    textbook_url = task_url(book, message.text)
+    snapshot = await state_snapshot(state)
+    try:
+        images = await admission.run("gdz", textbook_url, message.from_user.id, get_images_url, textbook_url)
+    except JobCancelled:
+        return
+    except (asyncio.TimeoutError, aiohttp.ClientError):
+        await bot.send_message(chat_id=message.chat.id,
+                               text="Сайт с решениями не ответил вовремя. Попробуйте ещё раз.")
+        return
+    if images:
+        prefetcher.schedule(book, message.text)
+        await send_images(bot, message.chat.id, images)
+        await finish_if_unchanged(state, snapshot)
     else:
         await bot.send_message(chat_id=message.chat.id,
                                text="Не нашлость такого задания или решения для него.\n"
                                     "Проверьте правильность ввода задания и попробуйте снова.")
 
 
+# Обработчик команды /reload_catalogue (перезагрузка каталога учебников)
+@dp.message_handler(commands=['reload_catalogue'])
+async def reload_catalogue(message: types.Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    await catalogue.load()
+    await message.reply("Каталог учебников перезагружен.")
+
+
 # Обработчик для команды /cancel
 @dp.message_handler(commands=['cancel'], state='*')
 async def cancel_translation(message: types.Message, state: FSMContext):
+    cancel_user_jobs(message.from_user.id)
     await bot.send_message(chat_id=message.chat.id,
                            text="Действие отменено.", reply_markup=main_menu_kb)
-    await bot.delete_message(chat_id=message.chat.id, message_id=message.message_id - 1)
-    await bot.delete_message(chat_id=message.chat.id, message_id=message.message_id - 2)
+    bot.delete_later(message.chat.id, message.message_id - 1)
+    bot.delete_later(message.chat.id, message.message_id - 2)
 
     await state.finish()
 
 
+# Фоновый прогрев после старта: процессы OCR с моделями и библиотеки поиска и перевода
+async def warm_up():
+    names = ["googlesearch"] + (["googletrans"] if TRANSLATE_BACKEND == "google" else [])
+    jobs = [backends.warm_up(names)]
+    if OCR_PRELOAD:
+        jobs.append(warm_up_workers())
+    await asyncio.gather(*jobs, return_exceptions=True)
+    backends.mark("warm_up")
+    logging.info(backends.startup_report())
+
+
+async def on_startup(dispatcher: Dispatcher):
+    if METRICS_PORT:
+        await start_metrics_server()
+        backends.mark("metrics_server")
+    await migrate()
+    await expire_results()
+    backends.mark("migrations")
+    await storage.init(expire_interval=FSM_EXPIRE_INTERVAL)
+    backends.mark("fsm_storage")
+    await catalogue.load()
+    backends.mark("catalogue")
+    if CATALOGUE_RELOAD_INTERVAL:
+        asyncio.create_task(catalogue.watch(CATALOGUE_RELOAD_INTERVAL))
+    logging.info(backends.startup_report())
+    if WARM_UP_BACKENDS:
+        asyncio.create_task(warm_up())
+
+
+async def on_shutdown(dispatcher: Dispatcher):
+    shutdown_workers()
+    await close_session()
+    await db.close()
+
+
 if __name__ == '__main__':
-    executor.start_polling(dp, skip_updates=True)
+    start(dp, on_startup=on_startup, on_shutdown=on_shutdown)
@@ -0,0 +1,108 @@
+import asyncio
+import functools
+
+from data.updates import release_chat
+from data.workers import JobCancelled, run_user_job
+
+
+# Запрос пользователя заменён его же более новым запросом того же типа
+class JobSuperseded(JobCancelled):
+    pass
+
+
+class _Slot:
+    def __init__(self, key, job, waiter):
+        self.key = key
+        self.job = job
+        self.waiter = waiter
+
+
+# Допуск дорогих задач (OCR, поиск, ГДЗ, перевод): у пользователя не больше одной задачи каждого типа.
+# Новый запрос того же типа заменяет старый: одинаковый запрос подхватывает уже идущую задачу,
+# другой — отменяет её. Ответ получает только последний запрос, предыдущий обработчик получает JobSuperseded.
+# Пока задача выполняется, чат отпускается, поэтому следующие сообщения пользователя (новое фото, /cancel)
+# обрабатываются сразу, а не после окончания задачи. Так как у каждого пользователя в пуле не больше одной
+# задачи каждого типа (считая отменённые, которые ещё выполняются), пулы (FIFO) делятся между пользователями поровну.
+class Admission:
+    def __init__(self):
+        self._slots = {}
+        self._stopping = {}
+        self.started = 0
+        self.coalesced = 0
+        self.superseded = 0
+
+    async def run(self, kind, key, user_id, func, *args):
+        loop = asyncio.get_running_loop()
+        user_kind = (user_id, kind)
+        stopping = self._stopping.get(user_kind, set())
+        previous = self._slots.get(user_kind)
+        if (previous is not None and previous.key == key and not previous.job.done()
+                and previous.job not in stopping):
+            job = previous.job
+            self.coalesced += 1
+        else:
+            if previous is not None and not previous.job.done():
+                self._cancel(user_kind, previous.job)
+            stopping = self._stopping.get(user_kind)
+            if stopping:
+                job = asyncio.ensure_future(_after(set(stopping), func, args))
+            else:
+                job = asyncio.ensure_future(func(*args))
+            self.started += 1
+        if previous is not None and not previous.waiter.done():
+            previous.waiter.set_exception(JobSuperseded(kind))
+            self.superseded += 1
+
+        waiter = loop.create_future()
+        slot = self._slots[user_kind] = _Slot(key, job, waiter)
+        job.add_done_callback(functools.partial(_resolve, waiter))
+        waiter.add_done_callback(functools.partial(self._cancelled, user_kind, slot))
+        release_chat()
+        try:
+            return await run_user_job(waiter, user_id, kind)
+        finally:
+            if self._slots.get(user_kind) is slot:
+                del self._slots[user_kind]
+
+    # Отменённая задача может ещё выполняться в пуле (начатое распознавание не прервать),
+    # поэтому следующая задача пользователя того же типа запускается только после её окончания
+    def _cancel(self, user_kind, job):
+        job.cancel()
+        self._stopping.setdefault(user_kind, set()).add(job)
+        job.add_done_callback(functools.partial(self._stopped, user_kind))
+
+    def _stopped(self, user_kind, job):
+        jobs = self._stopping.get(user_kind)
+        if jobs is not None:
+            jobs.discard(job)
+            if not jobs:
+                del self._stopping[user_kind]
+
+    # Отмена ожидания через /cancel отменяет и саму задачу, если её больше никто не ждёт
+    def _cancelled(self, user_kind, slot, waiter):
+        if waiter.cancelled() and self._slots.get(user_kind) is slot and not slot.job.done():
+            self._cancel(user_kind, slot.job)
+
+    def stats(self):
+        return {"running": len(self._slots), "stopping": sum(map(len, self._stopping.values())),
+                "started": self.started, "coalesced": self.coalesced, "superseded": self.superseded}
+
+
+# Запуск задачи после окончания отменённых задач пользователя того же типа
+async def _after(jobs, func, args):
+    await asyncio.wait(jobs)
+    return await func(*args)
+
+
+def _resolve(waiter, job):
+    if waiter.done():
+        return
+    if job.cancelled():
+        waiter.cancel()
+    elif job.exception() is not None:
+        waiter.set_exception(job.exception())
+    else:
+        waiter.set_result(job.result())
+
+
+admission = Admission()
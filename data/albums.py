@@ -0,0 +1,40 @@
+import asyncio
+
+from aiogram import types
+
+from data.config import ALBUM_WAIT
+from data.updates import release_chat
+
+
+# Сбор фото одного альбома: Telegram присылает каждое фото альбома отдельным сообщением.
+# Обработчик первого фото ждёт остальные и получает весь альбом, обработчики остальных фото получают None.
+class AlbumCollector:
+    def __init__(self, wait=ALBUM_WAIT):
+        self.wait = wait
+        self._albums = {}
+
+    async def collect(self, message: types.Message):
+        key = (message.chat.id, message.media_group_id)
+        album = self._albums.get(key)
+        if album is not None:
+            album.append(message)
+            return None
+
+        album = self._albums[key] = [message]
+        # Остальные фото альбома приходят в этот же чат, поэтому чат нужно отпустить
+        release_chat()
+        try:
+            # Ожидание продлевается, пока приходят новые фото
+            received = 0
+            while received != len(album):
+                received = len(album)
+                await asyncio.sleep(self.wait)
+        finally:
+            del self._albums[key]
+        return sorted(album, key=lambda item: item.message_id)
+
+    def stats(self):
+        return {"collecting": len(self._albums)}
+
+
+albums = AlbumCollector()
@@ -0,0 +1,72 @@
+import asyncio
+import importlib
+import logging
+import sys
+import threading
+import time
+
+# Тяжёлые библиотеки, которые загружаются только при первом использовании или фоновом прогреве
+HEAVY_MODULES = {
+    "cv2": "cv2",
+    "numpy": "numpy",
+    "easyocr": "easyocr",
+    "googlesearch": "googlesearch",
+    "googletrans": "googletrans",
+}
+
+_loaded = {}
+_lock = threading.Lock()
+
+# Этапы запуска бота и их длительность: [(название, секунды)]
+startup_phases = []
+_last_mark = time.perf_counter()
+
+
+# Модуль тяжёлой библиотеки; импортируется при первом обращении
+def get(name):
+    module = _loaded.get(name)
+    if module is not None:
+        return module[0]
+    with _lock:
+        if name not in _loaded:
+            started = time.perf_counter()
+            module = importlib.import_module(HEAVY_MODULES[name])
+            _loaded[name] = (module, time.perf_counter() - started)
+            logging.info("Загружен %s за %.2f с", name, _loaded[name][1])
+    return _loaded[name][0]
+
+
+# Фоновая загрузка библиотек, чтобы первый пользователь не ждал импорта
+async def warm_up(names):
+    loop = asyncio.get_running_loop()
+    for name in names:
+        try:
+            await loop.run_in_executor(None, get, name)
+        except ImportError:
+            logging.exception("Не удалось загрузить %s", name)
+
+
+# Отметка окончания этапа запуска: записывается время с предыдущей отметки
+def mark(name):
+    global _last_mark
+    now = time.perf_counter()
+    startup_phases.append((name, now - _last_mark))
+    _last_mark = now
+
+
+# Время загрузки уже импортированных тяжёлых библиотек
+def stats():
+    return {name: seconds for name, (module, seconds) in _loaded.items()}
+
+
+# Отчёт о запуске: этапы, загруженные тяжёлые библиотеки и число импортированных модулей
+def startup_report():
+    lines = ["Отчёт о запуске:"]
+    lines += [f"  {name:<24}{seconds:8.3f} с" for name, seconds in startup_phases]
+    for name in HEAVY_MODULES:
+        if name in _loaded:
+            lines.append(f"  {'import ' + name:<24}{_loaded[name][1]:8.3f} с")
+        else:
+            lines.append(f"  {'import ' + name:<24}{'не загружен':>10}")
+    lines.append(f"  модулей в sys.modules: {len(sys.modules)}")
+    return "\n".join(lines)
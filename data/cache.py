@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+# Ограниченный по размеру кэш с вытеснением давно неиспользуемых записей (LRU)
+# и необязательным временем жизни записей (ttl, в секундах).
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, count=False) is not MISSING
+
+    # Возвращает значение или MISSING, если записи нет или она устарела
+    def get(self, key, default=MISSING, count=True):
+        item = self._data.get(key, MISSING)
+        if item is not MISSING:
+            value, expires = item
+            if expires is None or expires > time.monotonic():
+                self._data.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return value
+            del self._data[key]
+        if count:
+            self.misses += 1
+        return default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl else None
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, MISSING)
+        return default if item is MISSING else item[0]
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
@@ -1 +1,93 @@
 BOT_TOKEN = "YOUR_BOT_TOKEN"
+
+# Настройки распознавания текста (easyocr)
+OCR_LANGUAGES = ["ru", "en"]
+OCR_PROCESSES = 1  # количество процессов, выполняющих OCR (в каждом одна модель и одно задание за раз)
+OCR_TIMEOUT = 120  # максимальное время распознавания одного фото в секундах
+OCR_GPU = True  # при отсутствии GPU автоматически используется CPU
+OCR_PRELOAD = True  # загружать модели при старте бота, а не при первом запросе
+OCR_MAX_DIMENSION = 1600  # фото уменьшается до этого размера большей стороны (0 — не уменьшать)
+OCR_DEBUG_CAPTURE = False  # сохранять присланные фото в data/photos для отладки
+OCR_BATCH_PAGES = 3  # сколько страниц альбома распознавать одним пакетом; ответ отправляется после каждого пакета
+ALBUM_WAIT = 1.0  # сколько секунд ждать следующее фото альбома
+
+# Ограничения для сетевых запросов, выполняемых в пуле потоков
+NETWORK_THREADS = 16
+SEARCH_CONCURRENCY = 2  # одновременных запросов в Google
+SEARCH_TIMEOUT = 30
+TRANSLATE_CONCURRENCY = 4  # одновременных запросов к переводчику
+TRANSLATE_TIMEOUT = 15
+
+# База данных
+DB_PATH = "data/database/bot.db"
+DB_COMMIT_DELAY = 0.05  # через сколько секунд фиксировать накопленные изменения (0 — сразу)
+DB_BATCH_SIZE = 100  # фиксировать досрочно после стольких изменений
+DB_CACHED_STATEMENTS = 128  # размер кэша подготовленных запросов
+USER_CACHE_SIZE = 10000  # сколько профилей пользователей держать в памяти
+USER_CACHE_TTL = 3600  # время жизни записи в кэше пользователей в секундах
+
+ADMIN_IDS = []  # user_id администраторов бота (команда /reload_catalogue)
+CATALOGUE_RELOAD_INTERVAL = 60  # как часто проверять изменения каталога учебников (0 — не проверять)
+
+# Кэш результатов поиска в Google
+SEARCH_CACHE_SIZE = 2000  # сколько запросов хранить
+SEARCH_CACHE_TTL = 6 * 3600  # время жизни результата в секундах
+SEARCH_EMPTY_TTL = 60  # как долго помнить, что по запросу ничего не нашлось
+SEARCH_RESULTS_TTL = 7 * 24 * 3600  # время жизни результата в базе данных (таблица search_results)
+PAGINATION_HANDLES = 20000  # сколько наборов результатов держать для кнопок листания
+PAGINATION_TTL = 24 * 3600
+
+# Загрузка страниц ГДЗ
+FETCH_CONCURRENCY = 8  # одновременных соединений с сайтом ГДЗ
+FETCH_TIMEOUT = 20
+FETCH_RETRIES = 2  # повторов при сетевых ошибках и ответах 5xx/429
+FETCH_BACKOFF = 0.5  # задержка перед первым повтором, дальше удваивается
+GDZ_CACHE_SIZE = 5000  # сколько страниц заданий держать в памяти
+GDZ_CACHE_TTL = 24 * 3600
+GDZ_NOT_FOUND_TTL = 600  # как долго помнить, что решения для задания нет
+GDZ_DISK_TTL = 30 * 24 * 3600  # время жизни разобранных страниц в базе данных
+PREFETCH_AHEAD = 2  # сколько следующих заданий загружать заранее (0 — не загружать)
+PREFETCH_RATE = 2  # запросов в секунду к сайту ГДЗ для предзагрузки и для обхода (data/crawler.py)
+PREFETCH_QUEUE = 200  # сколько заданий может ждать предзагрузки
+CRAWL_MAX_MISSES = 20  # обход учебника заканчивается после стольких ненайденных заданий подряд
+CRAWL_MAX_TASK = 2000  # наибольший номер задания при обходе
+MEDIA_CACHE_SIZE = 20000  # сколько file_id картинок держать в памяти
+
+# Перевод
+TRANSLATE_BACKEND = "google"  # "google" или "stub" (локальная заглушка для тестов)
+TRANSLATE_CACHE_SIZE = 20000  # сколько переведённых предложений держать в памяти
+TRANSLATE_PERSIST = True  # сохранять переводы в базе данных
+TRANSLATE_BATCH_DELAY = 0.05  # сколько секунд собирать одновременные запросы в одну пачку
+TRANSLATE_BATCH_SIZE = 50  # максимальный размер пачки (предложений)
+TRANSLATE_BATCH_CHARS = 4500  # максимальная длина пачки в символах (ограничение размера запроса к переводчику)
+
+# Хранилище состояний FSM в базе данных
+FSM_STATE_TTL = 24 * 3600  # через сколько секунд бездействия состояние считается брошенным
+FSM_EXPIRE_INTERVAL = 3600  # как часто удалять брошенные состояния
+
+# Приём обновлений
+BOT_MODE = "polling"  # "polling" или "webhook"
+UPDATE_WORKERS = 8  # сколько обновлений (из разных чатов) обрабатывать одновременно
+UPDATE_QUEUE_SIZE = 200  # сколько обновлений может ждать обработки, дальше приём замедляется
+PENDING_UPDATES = "drop"  # что делать с накопившимися за время простоя обновлениями: "drop" или "process"
+POLLING_TIMEOUT = 20
+WEBHOOK_URL = ""  # внешний адрес бота, например "https://example.com"
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_HOST = "0.0.0.0"
+WEBHOOK_PORT = 8080
+WEBHOOK_SECRET = ""  # секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+
+# Лимиты Telegram на исходящие сообщения
+RATE_GLOBAL = 30  # сообщений в секунду на всего бота
+RATE_CHAT = 1  # сообщений в секунду в личный чат
+RATE_GROUP = 20  # сообщений в минуту в групповой чат
+RATE_CHAT_BURST = 3  # сколько сообщений подряд можно отправить в чат без ожидания
+RETRY_AFTER_ATTEMPTS = 3  # сколько раз повторять запрос после ответа RetryAfter
+
+# Метрики (формат Prometheus) и профилировщик
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9100  # 0 — не запускать сервер метрик
+PROFILER_INTERVAL = 0.01  # период снятия стека профилировщиком в секундах
+
+# Запуск: тяжёлые библиотеки (easyocr, cv2, googlesearch, googletrans) импортируются при первом использовании
+WARM_UP_BACKENDS = True  # загружать их в фоне сразу после старта, не задерживая приём обновлений
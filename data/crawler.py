@@ -0,0 +1,101 @@
+# Обход учебников каталога и сохранение списков картинок всех заданий в базу данных (таблица gdz_images),
+# чтобы бот отвечал на большинство запросов ГДЗ с диска, не обращаясь к сайту.
+#
+# Задания перебираются по порядку (1, 2, 3, ...), обход учебника заканчивается после CRAWL_MAX_MISSES
+# ненайденных заданий подряд. Прогресс каждого учебника хранится в таблице gdz_crawl, поэтому прерванный
+# обход продолжается с того же места. Страницы, которые уже есть на диске и не устарели, повторно не загружаются.
+#
+# Запуск из корня репозитория (можно одновременно с ботом):
+#     python -m data.crawler
+#     python -m data.crawler --class 9 --rate 1
+#     python -m data.crawler --restart
+import argparse
+import asyncio
+import logging
+import time
+
+from data.config import PREFETCH_RATE, CRAWL_MAX_MISSES, CRAWL_MAX_TASK
+from data.database.catalogue import catalogue
+from data.database.connection import db
+from data.database.migrations import migrate
+from data.gdz import task_url, stored_images, fetch_images, close_session
+from data.sender import TokenBucket
+
+
+async def _save_progress(book, next_task, misses, found, finished_at=None):
+    await db.execute('INSERT OR REPLACE INTO gdz_crawl (user_class, book_id, next_task, misses, found, finished_at) '
+                     'VALUES (?, ?, ?, ?, ?, ?)', (book.user_class, book.book_id, next_task, misses, found, finished_at))
+
+
+# Обход одного учебника с места, на котором он остановился; возвращает количество найденных заданий
+async def crawl_book(book, bucket, max_misses=CRAWL_MAX_MISSES, max_task=CRAWL_MAX_TASK):
+    row = await db.fetchone('SELECT next_task, misses, found, finished_at FROM gdz_crawl '
+                            'WHERE user_class=? AND book_id=?', (book.user_class, book.book_id))
+    task, misses, found, finished_at = row or (1, 0, 0, None)
+    if finished_at is not None:
+        return found
+
+    while misses < max_misses and task <= max_task:
+        url = task_url(book, str(task))
+        images = await stored_images(url)
+        if images is None:
+            await bucket.acquire()
+            images = await fetch_images(url)
+        if images:
+            found += 1
+            misses = 0
+        else:
+            misses += 1
+        task += 1
+        await _save_progress(book, task, misses, found)
+
+    await _save_progress(book, task, misses, found, time.time())
+    logging.info("Учебник %s (%s класс): найдено заданий %s", book.name, book.user_class, found)
+    return found
+
+
+async def crawl(classes=None, rate=PREFETCH_RATE, parallel=4, restart=False):
+    await migrate()
+    await catalogue.load()
+    if restart:
+        await db.execute('DELETE FROM gdz_crawl')
+    books = [book for book in catalogue.books.values() if not classes or book.user_class in classes]
+    bucket = TokenBucket(rate, 1)
+    semaphore = asyncio.Semaphore(parallel)
+
+    async def crawl_one(book):
+        async with semaphore:
+            try:
+                return await crawl_book(book, bucket)
+            except Exception:
+                # Прогресс сохранён, при следующем запуске обход учебника продолжится
+                logging.exception("Обход учебника %s (%s класс) прерван", book.name, book.user_class)
+                return 0
+
+    started = time.perf_counter()
+    try:
+        found = await asyncio.gather(*(crawl_one(book) for book in books))
+        logging.info("Обход закончен за %.0f с: учебников %s, заданий %s",
+                     time.perf_counter() - started, len(books), sum(found))
+    finally:
+        await close_session()
+        await db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обход учебников ГДЗ и сохранение решений в базу данных")
+    parser.add_argument("--class", dest="classes", type=int, action="append", help="только учебники этого класса")
+    parser.add_argument("--rate", type=float, default=PREFETCH_RATE, help="запросов к сайту в секунду")
+    parser.add_argument("--parallel", type=int, default=4, help="сколько учебников обходить одновременно")
+    parser.add_argument("--restart", action="store_true", help="начать обход заново, забыв сохранённый прогресс")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(crawl(args.classes, args.rate, args.parallel, args.restart))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
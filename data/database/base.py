@@ -1,77 +1,79 @@
 import asyncio
-import sqlite3
+
+from data.cache import LRUCache, MISSING
+from data.config import USER_CACHE_SIZE, USER_CACHE_TTL
+from data.database.connection import db
+from data.database.catalogue import catalogue
+
+# Кэш строк таблицы users по user_id (None — пользователь не зарегистрирован)
+user_cache = LRUCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+# Обновление одного поля закэшированной строки пользователя
+def _update_cached_user(user_id, index, value):
+    row = user_cache.get(user_id, count=False)
+    if row is MISSING:
+        return
+    if row is None:
+        user_cache.pop(user_id)
+        return
+    row = list(row)
+    row[index] = value
+    user_cache.set(user_id, tuple(row))
 
 
 # Функция для проверки существования пользователя в базе данных
 async def check_user(user_id):
-    with sqlite3.connect("data/database/bot.db") as con:
-        cursor = con.cursor()
-        cursor.execute('SELECT * FROM users WHERE user_id=?', (user_id,))
-        return cursor.fetchone()
+    row = user_cache.get(user_id)
+    if row is MISSING:
+        row = await db.fetchone('SELECT id, user_id, user_class, google_query FROM users WHERE user_id=?',
+                                (user_id,))
+        user_cache.set(user_id, row)
+    return row
 
 
 # Функция для получения класса пользователя
 async def check_user_class(user_id):
-    with sqlite3.connect("data/database/bot.db") as con:
-        cursor = con.cursor()
-        cursor.execute('SELECT user_class FROM users WHERE user_id=?', (user_id,))
-        return cursor.fetchone()
+    row = await check_user(user_id)
+    return None if row is None else (row[2],)
 
 
 # Функция для добавления пользователя в базу данных
 async def add_user(user_id, user_class):
-    with sqlite3.connect("data/database/bot.db") as con:
-        cursor = con.cursor()
-        cursor.execute('INSERT INTO users (user_id, user_class) VALUES (?, ?)', (user_id, user_class))
-        con.commit()
+    row_id = await db.insert('INSERT INTO users (user_id, user_class) VALUES (?, ?)', (user_id, user_class))
+    user_cache.set(user_id, (row_id, user_id, user_class, None))
 
 
 # Функция для обновления класса пользователя в базе данных
 async def update_user_class(user_id, new_user_class):
-    with sqlite3.connect("data/database/bot.db") as con:
-        cursor = con.cursor()
-        cursor.execute('UPDATE users SET user_class=? WHERE user_id=?', (new_user_class, user_id))
-        con.commit()
+    await db.execute('UPDATE users SET user_class=? WHERE user_id=?', (new_user_class, user_id))
+    _update_cached_user(user_id, 2, new_user_class)
 
 
 # Функция для проверки существования пользователя в базе данных
 async def check_google_query(user_id):
-    with sqlite3.connect("data/database/bot.db") as con:
-        cursor = con.cursor()
-        cursor.execute('SELECT google_query FROM users WHERE user_id=?', (user_id,))
-        return cursor.fetchone()
+    row = await check_user(user_id)
+    return None if row is None else (row[3],)
 
 
 # Функция для добавления google-запроса пользователя
 async def add_google_query(user_id, user_query):
-    with sqlite3.connect("data/database/bot.db") as con:
-        cursor = con.cursor()
-        cursor.execute('UPDATE users SET google_query=? WHERE user_id=?', (user_query, user_id))
-        con.commit()
+    await db.execute('UPDATE users SET google_query=? WHERE user_id=?', (user_query, user_id))
+    _update_cached_user(user_id, 3, user_query)
 
 
 # Функция для удаления google-запроса пользователя
 async def delete_google_query(user_id):
-    with sqlite3.connect("data/database/bot.db") as con:
-        cursor = con.cursor()
-        cursor.execute('UPDATE users SET google_query=NULL WHERE user_id=?', (user_id,))
-        con.commit()
+    await db.execute('UPDATE users SET google_query=NULL WHERE user_id=?', (user_id,))
+    _update_cached_user(user_id, 3, None)
 
 
 # Функция для получения книг класса пользователя
 async def check_textbooks(user_class, book_subject):
-    with sqlite3.connect("data/database/bot.db") as con:
-        cursor = con.cursor()
-        cursor.execute(f'SELECT book_name FROM class_{user_class}_books WHERE book_subject=?',
-                       (book_subject,))
-        return cursor.fetchall()
+    return [(book.name,) for book in catalogue.textbooks(user_class, book_subject)]
 
 
 # Функция для получения книг класса пользователя
 async def check_textbook_url(user_class, book_name):
-    with sqlite3.connect("data/database/bot.db") as con:
-        cursor = con.cursor()
-        cursor.execute(f'SELECT book_url, book_url_2 FROM class_{user_class}_books WHERE book_name=?',
-                       (book_name,))
-        return cursor.fetchone()
-
+    book = catalogue.book_by_name(user_class, book_name)
+    return None if book is None else (book.url, book.url_2)
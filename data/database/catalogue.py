@@ -0,0 +1,72 @@
+import asyncio
+import logging
+from collections import namedtuple
+
+from data.database.connection import db
+from data.keyboards.textbooks import build_textbooks_kb
+
+Book = namedtuple("Book", ["book_id", "user_class", "subject", "name", "url", "url_2"])
+
+
+# Каталог учебников ГДЗ, загруженный из базы данных в память.
+# Индексы: класс -> предмет -> учебники, (класс, id учебника) -> учебник, (класс, название) -> учебник.
+class Catalogue:
+    def __init__(self):
+        self.subjects = {}
+        self.books = {}
+        self.names = {}
+        self.keyboards = {}
+        self.version = None
+
+    async def load(self):
+        rows = await db.fetchall('SELECT book_id, user_class, subject, name, url, url_2 FROM books '
+                                 'ORDER BY user_class, book_id')
+        subjects, books, names = {}, {}, {}
+        for row in rows:
+            book = Book(*row)
+            subjects.setdefault(book.user_class, {}).setdefault(book.subject, []).append(book)
+            books[(book.user_class, book.book_id)] = book
+            names[(book.user_class, book.name)] = book
+
+        self.subjects, self.books, self.names = subjects, books, names
+        self.keyboards = {(user_class, subject): build_textbooks_kb(class_books)
+                          for user_class, class_subjects in subjects.items()
+                          for subject, class_books in class_subjects.items()}
+        self.version = await self._version()
+        logging.info("Каталог учебников загружен: %s учебников", len(books))
+
+    # Номер версии каталога: увеличивается триггерами при каждом изменении таблицы books
+    async def _version(self):
+        row = await db.fetchone('SELECT version FROM books_version')
+        return row[0]
+
+    # Перезагрузка каталога, если учебники изменил другой процесс
+    async def reload_if_changed(self):
+        if await self._version() != self.version:
+            await self.load()
+            return True
+        return False
+
+    # Периодическая проверка изменений каталога
+    async def watch(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reload_if_changed()
+            except Exception:
+                logging.exception("Не удалось перезагрузить каталог учебников")
+
+    def textbooks(self, user_class, subject):
+        return self.subjects.get(int(user_class), {}).get(subject, [])
+
+    def textbooks_kb(self, user_class, subject):
+        return self.keyboards.get((int(user_class), subject))
+
+    def book(self, user_class, book_id):
+        return self.books.get((int(user_class), int(book_id)))
+
+    def book_by_name(self, user_class, book_name):
+        return self.names.get((int(user_class), book_name.strip()))
+
+
+catalogue = Catalogue()
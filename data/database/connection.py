@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+from data.config import DB_PATH, DB_COMMIT_DELAY, DB_BATCH_SIZE, DB_CACHED_STATEMENTS
+from data.metrics import timed
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+    "PRAGMA mmap_size=67108864",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+# Одно долгоживущее соединение с базой данных.
+# Все запросы выполняются в отдельном потоке, поэтому цикл событий бота не блокируется.
+# Записи выполняются сразу, но фиксируются (COMMIT) пачками: через DB_COMMIT_DELAY секунд
+# или после DB_BATCH_SIZE изменений.
+class Database:
+    def __init__(self, path, commit_delay=0.05, batch_size=100, cached_statements=128):
+        self.path = path
+        self.commit_delay = commit_delay
+        self.batch_size = batch_size
+        self.cached_statements = cached_statements
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self._con = None
+        self._pending = 0
+        self._flush_handle = None
+
+    # Выполняется только в потоке базы данных
+    def _connection(self):
+        if self._con is None:
+            self._con = sqlite3.connect(self.path, check_same_thread=False,
+                                        cached_statements=self.cached_statements)
+            for pragma in PRAGMAS:
+                self._con.execute(pragma)
+            logging.info("Открыто соединение с базой данных %s", self.path)
+        return self._con
+
+    def _fetchone(self, sql, params):
+        return self._connection().execute(sql, params).fetchone()
+
+    def _fetchall(self, sql, params):
+        return self._connection().execute(sql, params).fetchall()
+
+    def _write(self, sql, params, many):
+        con = self._connection()
+        cursor = con.executemany(sql, params) if many else con.execute(sql, params)
+        self._pending += 1
+        if self._pending >= self.batch_size or self.commit_delay <= 0:
+            self._commit()
+        return cursor.rowcount, cursor.lastrowid
+
+    def _read(self, func, args):
+        return func(self._connection(), *args)
+
+    def _apply(self, func, args):
+        result = func(self._connection(), *args)
+        self._pending += 1
+        if self._pending >= self.batch_size or self.commit_delay <= 0:
+            self._commit()
+        return result
+
+    def _commit(self):
+        if self._con is not None and self._pending:
+            self._con.commit()
+        self._pending = 0
+
+    def _close(self):
+        self._commit()
+        if self._con is not None:
+            self._con.close()
+            self._con = None
+
+    async def _call(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _schedule_flush(self):
+        if self.commit_delay > 0 and self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.commit_delay, lambda: asyncio.ensure_future(self.flush()))
+
+    @timed("sqlite")
+    async def fetchone(self, sql, params=()):
+        return await self._call(self._fetchone, sql, params)
+
+    @timed("sqlite")
+    async def fetchall(self, sql, params=()):
+        return await self._call(self._fetchall, sql, params)
+
+    # Изменение данных; возвращает количество затронутых строк
+    @timed("sqlite")
+    async def execute(self, sql, params=()):
+        rowcount, _ = await self._call(self._write, sql, params, False)
+        self._schedule_flush()
+        return rowcount
+
+    # Добавление строки; возвращает её rowid
+    @timed("sqlite")
+    async def insert(self, sql, params=()):
+        _, lastrowid = await self._call(self._write, sql, params, False)
+        self._schedule_flush()
+        return lastrowid
+
+    @timed("sqlite")
+    async def executemany(self, sql, seq_of_params):
+        rowcount, _ = await self._call(self._write, sql, seq_of_params, True)
+        self._schedule_flush()
+        return rowcount
+
+    # Выполнение func(connection, *args) в потоке базы данных только для чтения
+    @timed("sqlite")
+    async def read(self, func, *args):
+        return await self._call(self._read, func, args)
+
+    # Выполнение func(connection, *args) в потоке базы данных как одного изменения.
+    # Нужно для операций «прочитать-изменить-записать», которые не должны перемежаться с другими запросами.
+    @timed("sqlite")
+    async def apply(self, func, *args):
+        result = await self._call(self._apply, func, args)
+        self._schedule_flush()
+        return result
+
+    # Фиксация накопленных изменений
+    @timed("sqlite")
+    async def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        await self._call(self._commit)
+
+    async def close(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        await self._call(self._close)
+
+
+db = Database(DB_PATH, commit_delay=DB_COMMIT_DELAY, batch_size=DB_BATCH_SIZE,
+              cached_statements=DB_CACHED_STATEMENTS)
@@ -0,0 +1,168 @@
+import asyncio
+import copy
+import json
+import logging
+import time
+import typing
+
+from aiogram.dispatcher.storage import BaseStorage
+
+from data.database.connection import Database
+
+
+def _dump(value):
+    if not value:
+        return None
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def _load(value):
+    return json.loads(value) if value else {}
+
+
+# Хранилище состояний FSM в базе данных SQLite.
+# Состояния переживают перезапуск бота и доступны всем процессам бота, работающим с одним файлом базы.
+# Данные хранятся компактным JSON, пустые записи удаляются, а записи старше ttl считаются
+# брошенными и удаляются периодической очисткой.
+class SQLiteStorage(BaseStorage):
+    def __init__(self, db: Database, ttl=None):
+        self.db = db
+        self.ttl = ttl
+        self._expire_task = None
+
+    # Таблица fsm_states создаётся миграцией (data/database/migrations.py), здесь запускается только очистка
+    async def init(self, expire_interval=None):
+        if self.ttl and expire_interval:
+            self._expire_task = asyncio.create_task(self._expire_periodically(expire_interval))
+
+    async def close(self):
+        if self._expire_task is not None:
+            self._expire_task.cancel()
+            self._expire_task = None
+        await self.db.flush()
+
+    async def wait_closed(self):
+        pass
+
+    def _is_alive(self, updated_at):
+        return not self.ttl or updated_at > time.time() - self.ttl
+
+    # Чтение записи (выполняется в потоке базы данных)
+    def _read(self, con, chat, user):
+        row = con.execute('SELECT state, data, bucket, updated_at FROM fsm_states WHERE chat_id=? AND user_id=?',
+                          (chat, user)).fetchone()
+        if row is None or not self._is_alive(row[3]):
+            return {"state": None, "data": {}, "bucket": {}}
+        return {"state": row[0], "data": _load(row[1]), "bucket": _load(row[2])}
+
+    # Изменение записи: читаем, меняем функцией change и записываем (выполняется в потоке базы данных).
+    # Чтение и запись идут в одной транзакции BEGIN IMMEDIATE, чтобы другой процесс бота
+    # не изменил запись между ними; накопленные ранее изменения перед этим фиксируются.
+    def _modify(self, con, chat, user, change):
+        con.commit()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            record = self._read(con, chat, user)
+            change(record)
+            if record["state"] is None and not record["data"] and not record["bucket"]:
+                con.execute('DELETE FROM fsm_states WHERE chat_id=? AND user_id=?', (chat, user))
+            else:
+                con.execute('INSERT OR REPLACE INTO fsm_states (chat_id, user_id, state, data, bucket, updated_at) '
+                            'VALUES (?, ?, ?, ?, ?, ?)',
+                            (chat, user, record["state"], _dump(record["data"]), _dump(record["bucket"]), time.time()))
+        except Exception:
+            con.rollback()
+            raise
+        con.commit()
+
+    async def _get(self, chat, user, field):
+        chat, user = map(int, self.check_address(chat=chat, user=user))
+        record = await self.db.read(self._read, chat, user)
+        return record[field]
+
+    async def _change(self, chat, user, change):
+        chat, user = map(int, self.check_address(chat=chat, user=user))
+        await self.db.apply(self._modify, chat, user, change)
+
+    async def get_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        default: typing.Optional[str] = None) -> typing.Optional[str]:
+        state = await self._get(chat, user, "state")
+        return state if state is not None else self.resolve_state(default)
+
+    async def get_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       default: typing.Optional[dict] = None) -> typing.Dict:
+        return await self._get(chat, user, "data") or copy.deepcopy(default or {})
+
+    async def set_state(self, *,
+                        chat: typing.Union[str, int, None] = None,
+                        user: typing.Union[str, int, None] = None,
+                        state: typing.AnyStr = None):
+        state = self.resolve_state(state)
+        await self._change(chat, user, lambda record: record.update(state=state))
+
+    async def set_data(self, *,
+                       chat: typing.Union[str, int, None] = None,
+                       user: typing.Union[str, int, None] = None,
+                       data: typing.Dict = None):
+        data = copy.deepcopy(data or {})
+        await self._change(chat, user, lambda record: record.update(data=data))
+
+    async def update_data(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          data: typing.Dict = None, **kwargs):
+        data = copy.deepcopy(dict(data or {}, **kwargs))
+        await self._change(chat, user, lambda record: record["data"].update(data))
+
+    async def reset_state(self, *,
+                          chat: typing.Union[str, int, None] = None,
+                          user: typing.Union[str, int, None] = None,
+                          with_data: typing.Optional[bool] = True):
+        def change(record):
+            record["state"] = None
+            if with_data:
+                record["data"] = {}
+        await self._change(chat, user, change)
+
+    def has_bucket(self):
+        return True
+
+    async def get_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         default: typing.Optional[dict] = None) -> typing.Dict:
+        return await self._get(chat, user, "bucket") or copy.deepcopy(default or {})
+
+    async def set_bucket(self, *,
+                         chat: typing.Union[str, int, None] = None,
+                         user: typing.Union[str, int, None] = None,
+                         bucket: typing.Dict = None):
+        bucket = copy.deepcopy(bucket or {})
+        await self._change(chat, user, lambda record: record.update(bucket=bucket))
+
+    async def update_bucket(self, *,
+                            chat: typing.Union[str, int, None] = None,
+                            user: typing.Union[str, int, None] = None,
+                            bucket: typing.Dict = None, **kwargs):
+        bucket = copy.deepcopy(dict(bucket or {}, **kwargs))
+        await self._change(chat, user, lambda record: record["bucket"].update(bucket))
+
+    # Удаление брошенных состояний
+    async def expire(self):
+        if not self.ttl:
+            return 0
+        return await self.db.execute('DELETE FROM fsm_states WHERE updated_at < ?', (time.time() - self.ttl,))
+
+    async def _expire_periodically(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await self.expire()
+                if removed:
+                    logging.info("Удалено брошенных состояний FSM: %s", removed)
+            except Exception:
+                logging.exception("Не удалось удалить устаревшие состояния FSM")
@@ -0,0 +1,134 @@
+# Версии схемы базы данных бота. Номер версии хранится в PRAGMA user_version,
+# каждая миграция выполняется в отдельной транзакции и переводит базу на следующую версию.
+#
+# Бот обновляет базу при запуске (bot.py, on_startup). Обновить базу вручную, с резервной копией:
+#     python -m data.database.migrations
+#     python -m data.database.migrations path/to/bot.db --backup
+import argparse
+import logging
+import re
+import sqlite3
+import time
+
+from data.config import DB_PATH
+from data.database.connection import db
+
+BOOK_TABLE = re.compile(r"^class_(\d+)_books$")
+
+
+# Версия 1: таблицы class_9_books, class_10_books, class_11_books объединены в одну таблицу books
+# с индексами по (класс, предмет) и (класс, название). Номера учебников внутри класса сохраняются.
+def _books(con):
+    con.execute('CREATE TABLE books (user_class INTEGER NOT NULL, book_id INTEGER NOT NULL, '
+                'subject TEXT NOT NULL, name TEXT NOT NULL, url TEXT NOT NULL, url_2 TEXT NOT NULL, '
+                'PRIMARY KEY (user_class, book_id))')
+    con.execute('CREATE INDEX books_class_subject ON books (user_class, subject)')
+    con.execute('CREATE UNIQUE INDEX books_class_name ON books (user_class, name)')
+    tables = con.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'class_%_books'")
+    for (table,) in tables.fetchall():
+        match = BOOK_TABLE.match(table)
+        if match is None:
+            continue
+        con.execute(f'INSERT INTO books (user_class, book_id, subject, name, url, url_2) '
+                    f'SELECT ?, book_id, book_subject, TRIM(book_name), book_url, book_url_2 FROM {table}',
+                    (int(match.group(1)),))
+        con.execute(f'DROP TABLE {table}')
+
+
+# Версия 2: результаты поиска хранятся в таблице search_results (запрос -> ссылки) со сроком годности,
+# а в users.google_query — только нормализованный запрос.
+# Старые строки users.google_query со ссылками через запятую очищаются: исходный запрос по ним не восстановить.
+def _search_results(con):
+    con.execute('CREATE TABLE search_results (query TEXT PRIMARY KEY NOT NULL, links TEXT NOT NULL, '
+                'expires_at REAL NOT NULL) WITHOUT ROWID')
+    con.execute('CREATE INDEX search_results_expires ON search_results (expires_at)')
+    if con.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='users'").fetchone():
+        con.execute("UPDATE users SET google_query=NULL WHERE google_query LIKE 'http%'")
+
+
+# Версия 3: номер версии каталога в таблице books_version, который триггеры увеличивают при любом изменении books.
+# По нему бот узнаёт, что каталог изменился (PRAGMA data_version меняется при любой записи в базу).
+def _books_version(con):
+    con.execute('CREATE TABLE books_version (version INTEGER NOT NULL)')
+    con.execute('INSERT INTO books_version (version) VALUES (0)')
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        con.execute(f'CREATE TRIGGER books_{event.lower()} AFTER {event} ON books '
+                    f'BEGIN UPDATE books_version SET version=version+1; END')
+
+
+# Версия 4: таблицы, которые раньше создавал при запуске каждый модуль сам (init_storage):
+# gdz_images, telegram_files, translations, fsm_states и gdz_crawl. В уже работающих базах они есть,
+# поэтому создаются с IF NOT EXISTS.
+def _storage_tables(con):
+    con.execute('CREATE TABLE IF NOT EXISTS gdz_images '
+                '(url TEXT PRIMARY KEY NOT NULL, images TEXT NOT NULL, fetched_at REAL NOT NULL)')
+    con.execute('CREATE TABLE IF NOT EXISTS telegram_files '
+                '(source TEXT PRIMARY KEY NOT NULL, file_id TEXT NOT NULL)')
+    con.execute('CREATE TABLE IF NOT EXISTS translations '
+                '(src TEXT NOT NULL, dest TEXT NOT NULL, text TEXT NOT NULL, result TEXT NOT NULL, '
+                'PRIMARY KEY (src, dest, text))')
+    con.execute('CREATE TABLE IF NOT EXISTS fsm_states '
+                '(chat_id INTEGER NOT NULL, user_id INTEGER NOT NULL, state TEXT, data TEXT, '
+                'bucket TEXT, updated_at REAL NOT NULL, PRIMARY KEY (chat_id, user_id)) WITHOUT ROWID')
+    con.execute('CREATE INDEX IF NOT EXISTS fsm_states_updated_at ON fsm_states (updated_at)')
+    con.execute('CREATE TABLE IF NOT EXISTS gdz_crawl '
+                '(user_class INTEGER NOT NULL, book_id INTEGER NOT NULL, next_task INTEGER NOT NULL, '
+                'misses INTEGER NOT NULL, found INTEGER NOT NULL, finished_at REAL, '
+                'PRIMARY KEY (user_class, book_id)) WITHOUT ROWID')
+
+
+MIGRATIONS = [_books, _search_results, _books_version, _storage_tables]
+
+
+def schema_version(con):
+    return con.execute("PRAGMA user_version").fetchone()[0]
+
+
+# Применение всех недостающих миграций; возвращает номер версии, до которой обновлена база
+def upgrade(con):
+    con.commit()
+    version = schema_version(con)
+    for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+        started = time.perf_counter()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            migration(con)
+            con.execute(f"PRAGMA user_version={number}")
+        except Exception:
+            con.rollback()
+            raise
+        con.commit()
+        logging.info("База данных обновлена до версии %s (%s) за %.2f с",
+                     number, migration.__name__.strip("_"), time.perf_counter() - started)
+    return len(MIGRATIONS)
+
+
+# Обновление основной базы бота при запуске
+async def migrate():
+    return await db.apply(upgrade)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Обновление схемы базы данных бота")
+    parser.add_argument("path", nargs="?", default=DB_PATH)
+    parser.add_argument("--backup", action="store_true", help="сохранить копию базы в <path>.v<версия>.bak")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    con = sqlite3.connect(args.path)
+    try:
+        version = schema_version(con)
+        if version >= len(MIGRATIONS):
+            logging.info("База данных %s уже на версии %s", args.path, version)
+            return
+        if args.backup:
+            backup = sqlite3.connect(f"{args.path}.v{version}.bak")
+            con.backup(backup)
+            backup.close()
+        upgrade(con)
+    finally:
+        con.close()
+
+
+if __name__ == '__main__':
+    main()
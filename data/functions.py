@@ -1,18 +1,21 @@
-import cv2
-import easyocr
-import requests
-import asyncio
-from bs4 import BeautifulSoup
-from PIL import Image
-from googlesearch import search
-from googletrans import Translator
+from data import backends
+from data.metrics import timed
+from data.ocr import extract_text, extract_texts
+from data.gdz import get_images
+from data.translation import translation_engine
+from data.workers import ocr_workers, search_workers
 
 
 # Извлечение текста с изображения
-async def text_extract(image):
-    image = cv2.imread(image)
-    text = easyocr.Reader(["ru", "en"], gpu=True).readtext(image, detail=0, paragraph=True)
-    return "\n".join(text)
+@timed("ocr")
+async def text_extract(image, user_id=None):
+    return await ocr_workers.run(extract_text, image, user_id=user_id)
+
+
+# Извлечение текста с нескольких изображений одним пакетом
+@timed("ocr")
+async def text_extract_batch(images, user_id=None):
+    return await ocr_workers.run(extract_texts, images, user_id=user_id)
 
 
 SUPPORTED_LANGUAGES = ["Английский", "Русский"]
@@ -22,29 +25,26 @@ language_codes = {
     "Английский": "en"
 }
 
-translator = Translator()
-
 
 # Перевод текста с исходного языка в нужный
-async def translate_text(text, src_lang, dest_lang):
-    return translator.translate(text, src=language_codes[src_lang], dest=language_codes[dest_lang]).text
+@timed("translate")
+async def translate_text(text, src_lang, dest_lang, user_id=None):
+    return await translation_engine.translate(text, language_codes[src_lang], language_codes[dest_lang],
+                                              user_id=user_id)
 
 
-# Запрос в Google
-async def google_query(query):
+def _google_query(query):
+    search = backends.get("googlesearch").search
     return [site for site in search(query, tld="co.in", num=3, stop=3, pause=2)]
 
 
-async def getdata(url):
-    r = requests.get(url)
-    return r.text
+# Запрос в Google
+@timed("google")
+async def google_query(query, user_id=None):
+    return await search_workers.run(_google_query, query, user_id=user_id)
 
 
-async def get_images_url(url):
-    htmldata = await getdata(url)
-    soup = BeautifulSoup(htmldata, 'html.parser')
-    items = []
-    for item in soup.find_all('img'):
-        if "tasks" in item["src"]:
-            items.append(item['src'][2:])
-    return items
+# Ссылки на картинки с решением со страницы задания ГДЗ
+@timed("gdz")
+async def get_images_url(url, user_id=None):
+    return await get_images(url, user_id=user_id)
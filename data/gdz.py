@@ -0,0 +1,176 @@
+import asyncio
+import html as html_lib
+import logging
+import re
+import time
+
+import aiohttp
+
+from data.cache import LRUCache, MISSING
+from data.config import (FETCH_CONCURRENCY, FETCH_TIMEOUT, FETCH_RETRIES, FETCH_BACKOFF,
+                         GDZ_CACHE_SIZE, GDZ_CACHE_TTL, GDZ_NOT_FOUND_TTL, GDZ_DISK_TTL,
+                         PREFETCH_AHEAD, PREFETCH_RATE, PREFETCH_QUEUE)
+from data.database.connection import db
+from data.sender import TokenBucket
+from data.workers import run_user_job
+
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+# Атрибут src тега img (не data-src) в кавычках или без них
+IMG_SRC = re.compile(r'<img\b[^>]*?(?<![-\w])src\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s"\'>]+))', re.IGNORECASE)
+TASK_NUMBER = re.compile(r'([\d.]*?)(\d+)')
+
+# Кэш списков картинок с решениями: адрес страницы задания -> кортеж ссылок на картинки
+images_cache = LRUCache(GDZ_CACHE_SIZE, GDZ_CACHE_TTL)
+
+# Страницы, загружающиеся прямо сейчас (одинаковые запросы ждут одну загрузку)
+_in_flight = {}
+
+_session = None
+
+
+# Общая HTTP-сессия с пулом keep-alive соединений
+def get_session():
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=FETCH_CONCURRENCY, ttl_dns_cache=300)
+        _session = aiohttp.ClientSession(connector=connector,
+                                         timeout=aiohttp.ClientTimeout(total=FETCH_TIMEOUT),
+                                         headers={"User-Agent": USER_AGENT})
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+# Загрузка страницы с повторами и экспоненциальной задержкой; None, если страницы нет
+async def fetch_page(url):
+    for attempt in range(FETCH_RETRIES + 1):
+        try:
+            async with get_session().get(url) as response:
+                if response.status == 404:
+                    return None
+                if response.status < 500 and response.status != 429:
+                    response.raise_for_status()
+                    return await response.text()
+                error = aiohttp.ClientResponseError(response.request_info, response.history,
+                                                    status=response.status)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            error = e
+        if attempt < FETCH_RETRIES:
+            delay = FETCH_BACKOFF * 2 ** attempt
+            logging.warning("Не удалось загрузить %s (%s), повтор через %.1f с", url, error, delay)
+            await asyncio.sleep(delay)
+    raise error
+
+
+# Быстрый разбор страницы: ищем только теги img с картинками заданий
+def parse_images(html):
+    sources = (html_lib.unescape("".join(groups)) for groups in IMG_SRC.findall(html))
+    return [src[2:] for src in sources if "tasks" in src]
+
+
+# Разобранная страница из базы данных; None, если её нет или она устарела
+async def stored_images(url):
+    row = await db.fetchone('SELECT images, fetched_at FROM gdz_images WHERE url=?', (url,))
+    if row is not None and time.time() - row[1] < GDZ_DISK_TTL:
+        return row[0].split("\n")
+    return None
+
+
+# Загрузка страницы с сайта и сохранение найденных картинок в базу данных
+async def fetch_images(url):
+    html = await fetch_page(url)
+    images = parse_images(html) if html else []
+    if images:
+        await db.execute('INSERT OR REPLACE INTO gdz_images (url, images, fetched_at) VALUES (?, ?, ?)',
+                         (url, "\n".join(images), time.time()))
+    return images
+
+
+async def _load_images(url):
+    images = await stored_images(url)
+    if images is not None:
+        return images
+    return await fetch_images(url)
+
+
+def _store_images(url, future):
+    _in_flight.pop(url, None)
+    if not future.cancelled() and future.exception() is None:
+        images = tuple(future.result())
+        images_cache.set(url, images, ttl=None if images else GDZ_NOT_FOUND_TTL)
+
+
+# Ссылки на картинки с решением задания: из памяти, с диска или с сайта
+async def get_images(url, user_id=None):
+    images = images_cache.get(url)
+    if images is not MISSING:
+        return list(images)
+
+    future = _in_flight.get(url)
+    if future is None:
+        future = asyncio.ensure_future(_load_images(url))
+        _in_flight[url] = future
+        future.add_done_callback(lambda f: _store_images(url, f))
+
+    if user_id is None:
+        return list(await asyncio.shield(future))
+    return list(await run_user_job(asyncio.shield(future), user_id, "gdz"))
+
+
+# Адрес страницы задания в учебнике
+def task_url(book, task):
+    return book.url + task.replace(".", "-") + book.url_2
+
+
+# Номера заданий, которые обычно спрашивают следом: 123 -> 124, 125; 12.1 -> 12.2, 12.3
+def next_tasks(task, count):
+    match = TASK_NUMBER.fullmatch(task.strip())
+    if match is None:
+        return []
+    prefix, number = match.groups()
+    return [f"{prefix}{int(number) + i}" for i in range(1, count + 1)]
+
+
+# Фоновая загрузка следующих заданий учебника, пока ученик смотрит текущее.
+# Запросы к сайту ограничены по частоте, страницы с диска загружаются в память без ограничения.
+class Prefetcher:
+    def __init__(self, ahead, rate, max_pending):
+        self.ahead = ahead
+        self.max_pending = max_pending
+        self.bucket = TokenBucket(rate, 1)
+        self._pending = {}
+        self.scheduled = 0
+        self.fetched = 0
+
+    def schedule(self, book, task):
+        for number in next_tasks(task, self.ahead):
+            url = task_url(book, number)
+            if url in images_cache or url in _in_flight or url in self._pending:
+                continue
+            if len(self._pending) >= self.max_pending:
+                return
+            job = asyncio.ensure_future(self._prefetch(url))
+            self._pending[url] = job
+            job.add_done_callback(lambda f, url=url: self._pending.pop(url, None))
+            self.scheduled += 1
+
+    async def _prefetch(self, url):
+        try:
+            if await stored_images(url) is None:
+                await self.bucket.acquire()
+                self.fetched += 1
+            await get_images(url)
+        except Exception as e:
+            logging.info("Не удалось заранее загрузить %s: %s", url, e)
+
+    def stats(self):
+        return {"pending": len(self._pending), "scheduled": self.scheduled, "fetched": self.fetched}
+
+
+prefetcher = Prefetcher(PREFETCH_AHEAD, PREFETCH_RATE, PREFETCH_QUEUE)
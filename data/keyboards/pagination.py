@@ -0,0 +1,15 @@
+from aiogram import types
+
+
+# Клавиатура листания результатов поиска
+def build_pagination_kb(handle, index, total, user_id):
+    keyboard = types.InlineKeyboardMarkup(row_width=2)
+    buttons = []
+    if index > 0:
+        buttons.append(types.InlineKeyboardButton(
+            text="⬅ Назад", callback_data=f"backward_{index}_{handle}_{user_id}"))
+    if index < total - 1:
+        buttons.append(types.InlineKeyboardButton(
+            text="Вперёд ➡", callback_data=f"forward_{index}_{handle}_{user_id}"))
+    keyboard.add(*buttons)
+    return keyboard
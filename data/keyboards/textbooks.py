@@ -0,0 +1,9 @@
+from aiogram import types
+
+
+# Клавиатура выбора учебника для одного предмета (строится из каталога учебников)
+def build_textbooks_kb(books):
+    keyboard = types.InlineKeyboardMarkup()
+    for book in books:
+        keyboard.add(types.InlineKeyboardButton(book.name, callback_data=f'textbook:{book.user_class}:{book.book_id}'))
+    return keyboard
@@ -0,0 +1,92 @@
+import logging
+
+from aiogram import types
+from aiogram.utils.exceptions import BadRequest
+
+from data.cache import LRUCache, MISSING
+from data.config import MEDIA_CACHE_SIZE
+from data.database.connection import db
+
+MEDIA_GROUP_LIMIT = 10  # максимум фото в одном альбоме Telegram
+
+# Уже загруженные в Telegram картинки: ссылка на источник -> file_id
+file_ids = LRUCache(MEDIA_CACHE_SIZE)
+
+
+def _photo_url(source):
+    return source if "://" in source else "https://" + source
+
+
+async def _load_file_ids(sources):
+    result = {}
+    missing = []
+    for source in sources:
+        file_id = file_ids.get(source)
+        if file_id is MISSING:
+            missing.append(source)
+        else:
+            result[source] = file_id
+    if missing:
+        placeholders = ", ".join("?" * len(missing))
+        rows = await db.fetchall(f'SELECT source, file_id FROM telegram_files WHERE source IN ({placeholders})',
+                                 missing)
+        for source, file_id in rows:
+            file_ids.set(source, file_id)
+            result[source] = file_id
+    return result
+
+
+async def _remember_file_ids(pairs):
+    if not pairs:
+        return
+    for source, file_id in pairs:
+        file_ids.set(source, file_id)
+    await db.executemany('INSERT OR REPLACE INTO telegram_files (source, file_id) VALUES (?, ?)', pairs)
+
+
+async def _forget_file_ids(sources):
+    for source in sources:
+        file_ids.pop(source)
+    await db.executemany('DELETE FROM telegram_files WHERE source=?', [(source,) for source in sources])
+
+
+async def _send_batch(bot, chat_id, media):
+    if len(media) == 1:
+        return [await bot.send_photo(chat_id, media[0])]
+    return await bot.send_media_group(chat_id, [types.InputMediaPhoto(item) for item in media])
+
+
+# Отправка картинок альбомами по 10 штук.
+# После первой отправки запоминаем file_id каждой картинки, и дальше Telegram не скачивает её заново.
+async def send_images(bot, chat_id, sources):
+    known = await _load_file_ids(sources)
+    for start in range(0, len(sources), MEDIA_GROUP_LIMIT):
+        batch = sources[start:start + MEDIA_GROUP_LIMIT]
+        media = [known.get(source) or _photo_url(source) for source in batch]
+        try:
+            messages = await _send_batch(bot, chat_id, media)
+        except BadRequest as e:
+            cached = [source for source in batch if source in known]
+            if cached:
+                # Сохранённый file_id перестал работать — отправляем по ссылкам
+                logging.warning("Не удалось отправить картинки по file_id: %s", e)
+                await _forget_file_ids(cached)
+                for source in cached:
+                    del known[source]
+                media = [_photo_url(source) for source in batch]
+                try:
+                    messages = await _send_batch(bot, chat_id, media)
+                except BadRequest:
+                    messages = None
+            else:
+                messages = None
+            if messages is None:
+                # Telegram не смог скачать картинки — отправляем ссылки текстом, как раньше
+                logging.warning("Не удалось отправить картинки альбомом: %s", e)
+                for source in batch:
+                    await bot.send_message(chat_id=chat_id, text=source)
+                continue
+
+        await _remember_file_ids([(source, message.photo[-1].file_id)
+                                  for source, message in zip(batch, messages)
+                                  if source not in known and message.photo])
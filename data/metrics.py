@@ -0,0 +1,186 @@
+import functools
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+
+from aiogram.dispatcher.handler import current_handler
+from aiogram.dispatcher.middlewares import BaseMiddleware
+from aiohttp import web
+
+from data.config import METRICS_HOST, METRICS_PORT, PROFILER_INTERVAL
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+# Гистограмма задержек в формате Prometheus
+class Histogram:
+    def __init__(self, name, help_text, buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self.buckets), 0, 0.0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        series[1] += 1
+        series[2] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key, (counts, count, total) in self._series.items():
+            labels = ",".join(f'{name}="{value}"' for name, value in key)
+            prefix = labels + "," if labels else ""
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            lines.append(f"{self.name}_count{{{labels}}} {count}")
+            lines.append(f"{self.name}_sum{{{labels}}} {total}")
+        return lines
+
+
+handler_latency = Histogram("bot_handler_latency_seconds", "Время работы обработчиков бота")
+backend_latency = Histogram("bot_backend_latency_seconds", "Время обращений к внешним сервисам и базе данных")
+backend_errors = Counter()
+
+# Источники текущих значений (кэши, очереди, пулы): имя -> функция, возвращающая словарь чисел
+_stats_sources = {}
+
+
+def register_stats(name, source):
+    _stats_sources[name] = source
+
+
+# Декоратор для замера времени асинхронного обращения к сервису
+def timed(backend, operation=None):
+    def decorator(func):
+        op = operation or func.__name__
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                backend_errors[(backend, op)] += 1
+                raise
+            finally:
+                backend_latency.observe(time.perf_counter() - started, backend=backend, operation=op)
+        return wrapper
+    return decorator
+
+
+# Middleware для замера времени каждого обработчика
+class MetricsMiddleware(BaseMiddleware):
+    async def trigger(self, action, args):
+        data = args[-1]
+        if action.startswith("process_"):
+            handler = current_handler.get()
+            data["_metrics_handler"] = getattr(handler, "__name__", "unknown")
+            data["_metrics_started"] = time.perf_counter()
+        elif action.startswith("post_process_") and "_metrics_started" in data:
+            handler_latency.observe(time.perf_counter() - data.pop("_metrics_started"),
+                                    handler=data.pop("_metrics_handler"))
+
+
+def render_metrics():
+    lines = handler_latency.render() + backend_latency.render()
+    lines += ["# HELP bot_backend_errors_total Ошибки обращений к сервисам", "# TYPE bot_backend_errors_total counter"]
+    for (backend, operation), count in backend_errors.items():
+        lines.append(f'bot_backend_errors_total{{backend="{backend}",operation="{operation}"}} {count}')
+    for name, source in _stats_sources.items():
+        try:
+            stats = source()
+        except Exception:
+            logging.exception("Не удалось получить метрики %s", name)
+            continue
+        for key, value in stats.items():
+            if isinstance(value, (int, float)):
+                lines.append(f"bot_{name}_{key} {float(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# Сэмплирующий профилировщик: периодически снимает стек главного потока и считает самые частые
+class SamplingProfiler:
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = Counter()
+        self.total = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._target = threading.main_thread().ident
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.samples.clear()
+        self.total = 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            stack = tuple(f"{item.filename}:{item.lineno} {item.name}"
+                          for item in traceback.extract_stack(frame, limit=8))
+            self.samples[stack] += 1
+            self.total += 1
+
+    def report(self, top=20):
+        lines = [f"samples: {self.total}, running: {self.running}"]
+        for stack, count in self.samples.most_common(top):
+            lines.append(f"\n{count} ({count / self.total:.1%})")
+            lines.extend("    " + line for line in stack)
+        return "\n".join(lines) + "\n"
+
+
+profiler = SamplingProfiler(PROFILER_INTERVAL)
+
+
+async def _metrics_handler(request):
+    return web.Response(text=render_metrics(), content_type="text/plain")
+
+
+async def _profiler_handler(request):
+    action = request.match_info.get("action")
+    if action == "start":
+        profiler.start()
+    elif action == "stop":
+        profiler.stop()
+    return web.Response(text=profiler.report(), content_type="text/plain")
+
+
+# HTTP-сервер метрик: /metrics, /profiler, /profiler/start, /profiler/stop
+async def start_metrics_server():
+    app = web.Application()
+    app.router.add_get("/metrics", _metrics_handler)
+    app.router.add_get("/profiler", _profiler_handler)
+    app.router.add_post("/profiler/{action}", _profiler_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, METRICS_HOST, METRICS_PORT).start()
+    logging.info("Метрики доступны на http://%s:%s/metrics", METRICS_HOST, METRICS_PORT)
+    return runner
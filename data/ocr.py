@@ -0,0 +1,101 @@
+import logging
+import threading
+
+from data import backends
+from data.config import OCR_LANGUAGES, OCR_GPU, OCR_PRELOAD, OCR_MAX_DIMENSION
+
+
+# Проверка наличия GPU для easyocr
+def gpu_available():
+    try:
+        import torch
+    except ImportError:
+        return False
+    return torch.cuda.is_available()
+
+
+# Модель easyocr процесса-обработчика OCR.
+# Процесс выполняет одно задание за раз, поэтому модель в нём одна; она загружается при старте процесса
+# (OCR_PRELOAD) или при первом запросе. Параллельность распознавания задаётся числом процессов OCR_PROCESSES,
+# очередь и задержки видны в статистике пула ocr_workers в основном процессе (data/workers.py).
+class OcrReader:
+    def __init__(self, languages, gpu=True):
+        self.languages = list(languages)
+        self.gpu = gpu
+        self._reader = None
+        self._lock = threading.Lock()
+
+    # Выполняется только в процессе-обработчике: там же проверяется наличие GPU (импорт torch)
+    def _create_reader(self):
+        self.gpu = self.gpu and gpu_available()
+        logging.info("Загрузка модели easyocr %s (gpu=%s)", self.languages, self.gpu)
+        return backends.get("easyocr").Reader(self.languages, gpu=self.gpu)
+
+    def get(self):
+        with self._lock:
+            if self._reader is None:
+                self._reader = self._create_reader()
+            return self._reader
+
+    def readtext(self, image, **kwargs):
+        return self.get().readtext(image, **kwargs)
+
+    # Распознавание нескольких изображений одного размера за один проход модели
+    def readtext_batched(self, images, **kwargs):
+        return self.get().readtext_batched(images, **kwargs)
+
+
+ocr_reader = OcrReader(OCR_LANGUAGES, gpu=OCR_GPU)
+
+
+# Инициализация процесса-обработчика OCR (см. data/workers.py)
+def init_ocr_process():
+    if OCR_PRELOAD:
+        ocr_reader.get()
+
+
+# Декодирование изображения из памяти (без записи на диск)
+def decode_image(data):
+    cv2, np = backends.get("cv2"), backends.get("numpy")
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+# Уменьшение изображения, чтобы большая сторона не превышала max_dimension
+def downscale(image, max_dimension=OCR_MAX_DIMENSION):
+    height, width = image.shape[:2]
+    scale = max_dimension / max(height, width)
+    if not max_dimension or scale >= 1:
+        return image
+    cv2 = backends.get("cv2")
+    return cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+# Извлечение текста с изображения (выполняется в процессе-обработчике)
+def extract_text(data):
+    image = decode_image(data)
+    if image is None:
+        return ""
+    text = ocr_reader.readtext(downscale(image), detail=0, paragraph=True)
+    return "\n".join(text)
+
+
+# Извлечение текста с нескольких страниц (выполняется в процессе-обработчике).
+# Страницы одного размера (обычно все фото одного альбома) распознаются одним пакетом.
+def extract_texts(pages):
+    groups = {}
+    for index, data in enumerate(pages):
+        image = decode_image(data)
+        if image is not None:
+            image = downscale(image)
+            groups.setdefault(image.shape, []).append((index, image))
+
+    texts = [""] * len(pages)
+    for group in groups.values():
+        indexes, images = zip(*group)
+        if len(images) == 1:
+            results = [ocr_reader.readtext(images[0], detail=0, paragraph=True)]
+        else:
+            results = ocr_reader.readtext_batched(list(images), detail=0, paragraph=True)
+        for index, lines in zip(indexes, results):
+            texts[index] = "\n".join(lines)
+    return texts
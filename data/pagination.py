@@ -0,0 +1,27 @@
+import hashlib
+
+from data.cache import LRUCache, MISSING
+from data.config import PAGINATION_HANDLES, PAGINATION_TTL
+
+# Результаты поиска, на которые ссылаются кнопки листания: handle -> кортеж ссылок.
+# Кортеж тот же, что лежит в кэше поиска, ссылки не копируются.
+result_handles = LRUCache(PAGINATION_HANDLES, PAGINATION_TTL)
+
+
+# Короткий идентификатор результатов для callback_data — хэш нормализованного запроса.
+# По нему можно проверить, что сохранённый запрос пользователя тот же, что у сообщения с кнопками.
+def query_handle(query):
+    return hashlib.sha1(query.encode()).hexdigest()[:8]
+
+
+# Сохранение результатов запроса для листания; возвращает идентификатор для callback_data
+def register_results(query, links):
+    handle = query_handle(query)
+    result_handles.set(handle, tuple(links))
+    return handle
+
+
+# Результаты по идентификатору или None, если они устарели (например, после перезапуска бота)
+def get_results(handle):
+    links = result_handles.get(handle)
+    return None if links is MISSING else links
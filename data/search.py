@@ -0,0 +1,64 @@
+import asyncio
+import time
+
+from data.cache import LRUCache, MISSING
+from data.config import SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SEARCH_EMPTY_TTL, SEARCH_RESULTS_TTL
+from data.database.connection import db
+from data.functions import google_query
+from data.workers import run_user_job
+
+# Общий для всех пользователей кэш результатов: нормализованный запрос -> кортеж ссылок
+search_cache = LRUCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+
+# Запросы в Google, выполняющиеся прямо сейчас (одинаковые запросы ждут один и тот же ответ)
+_in_flight = {}
+
+
+# Приведение запроса к виду, по которому ищется результат в кэше
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+# Результаты из базы данных, если они ещё не устарели, иначе — запрос в Google с сохранением в базу
+async def _load_links(key):
+    row = await db.fetchone('SELECT links FROM search_results WHERE query=? AND expires_at>?', (key, time.time()))
+    if row is not None:
+        return row[0].split("\n")
+
+    links = await google_query(key)
+    if links:
+        await db.execute('INSERT OR REPLACE INTO search_results (query, links, expires_at) VALUES (?, ?, ?)',
+                         (key, "\n".join(links), time.time() + SEARCH_RESULTS_TTL))
+    return links
+
+
+# Удаление устаревших результатов из базы данных
+async def expire_results():
+    return await db.execute('DELETE FROM search_results WHERE expires_at<=?', (time.time(),))
+
+
+# Пустой ответ может означать, что Google показал страницу согласия или капчу, поэтому он хранится недолго
+def _store_result(key, future):
+    _in_flight.pop(key, None)
+    if not future.cancelled() and future.exception() is None:
+        links = tuple(future.result())
+        search_cache.set(key, links, ttl=None if links else SEARCH_EMPTY_TTL)
+
+
+# Поиск ссылок с кэшированием и объединением одинаковых одновременных запросов.
+# Отмена ожидания одним пользователем не прерывает запрос, который ждут остальные.
+async def cached_search(query, user_id=None):
+    key = normalize_query(query)
+    links = search_cache.get(key)
+    if links is not MISSING:
+        return links
+
+    future = _in_flight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_load_links(key))
+        _in_flight[key] = future
+        future.add_done_callback(lambda f: _store_result(key, f))
+
+    if user_id is None:
+        return tuple(await asyncio.shield(future))
+    return tuple(await run_user_job(asyncio.shield(future), user_id, "search"))
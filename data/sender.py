@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.utils.exceptions import RetryAfter, TelegramAPIError
+
+from data.cache import LRUCache, MISSING
+from data.metrics import backend_latency, backend_errors
+from data.config import RATE_GLOBAL, RATE_CHAT, RATE_GROUP, RATE_CHAT_BURST, RETRY_AFTER_ATTEMPTS
+
+# Методы, которые отправляют или меняют сообщения и подпадают под лимиты Telegram
+THROTTLED_PREFIXES = ("send", "edit", "forward", "copy", "delete")
+# Удаление сообщений не занимает лимит чата, чтобы фоновая очистка (delete_later) не задерживала ответы
+CHAT_UNLIMITED_METHODS = ("deleteMessage",)
+EDIT_METHODS = ("editMessageText", "editMessageCaption", "editMessageMedia", "editMessageReplyMarkup")
+
+
+# Ведро токенов: не больше rate запросов в секунду с запасом capacity на короткие всплески
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    # Пауза после ответа Telegram «RetryAfter»
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    # Возврат неиспользованного токена
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+# Бот, который соблюдает лимиты Telegram на исходящие сообщения:
+# общий лимит в секунду, лимит на чат (для групп — строже), автоматическое ожидание при RetryAfter.
+# Несколько ожидающих правок одного и того же сообщения схлопываются: отправляется только последняя.
+class ThrottledBot(Bot):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.global_bucket = TokenBucket(RATE_GLOBAL, RATE_GLOBAL)
+        self.chat_buckets = LRUCache(10000)
+        self._latest_edits = {}
+        self._background = set()
+        self.retries = 0
+        self.merged_edits = 0
+
+    def _chat_bucket(self, chat_id):
+        bucket = self.chat_buckets.get(chat_id, count=False)
+        if bucket is MISSING:
+            if str(chat_id).startswith("-"):
+                bucket = TokenBucket(RATE_GROUP / 60, RATE_CHAT_BURST)
+            else:
+                bucket = TokenBucket(RATE_CHAT, RATE_CHAT_BURST)
+            self.chat_buckets.set(chat_id, bucket)
+        return bucket
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await self._request(method, data, files, **kwargs)
+        except Exception:
+            backend_errors[("telegram", method)] += 1
+            raise
+        finally:
+            backend_latency.observe(time.perf_counter() - started, backend="telegram", operation=method)
+
+    async def _request(self, method, data=None, files=None, **kwargs):
+        chat_id = (data or {}).get("chat_id")
+        if chat_id is None or not method.startswith(THROTTLED_PREFIXES):
+            return await super().request(method, data, files, **kwargs)
+
+        edit_key = None
+        if method in EDIT_METHODS and data.get("message_id") is not None:
+            edit_key = (method, str(chat_id), data["message_id"])
+            self._latest_edits[edit_key] = data
+
+        chat_bucket = None if method in CHAT_UNLIMITED_METHODS else self._chat_bucket(str(chat_id))
+        try:
+            for attempt in range(RETRY_AFTER_ATTEMPTS + 1):
+                if chat_bucket is not None:
+                    await chat_bucket.acquire()
+                await self.global_bucket.acquire()
+                if edit_key is not None and self._latest_edits.get(edit_key) is not data:
+                    # Пока ждали очереди, пришла более новая правка этого сообщения
+                    chat_bucket.refund()
+                    self.global_bucket.refund()
+                    self.merged_edits += 1
+                    return True
+                try:
+                    return await super().request(method, data, files, **kwargs)
+                except RetryAfter as e:
+                    if attempt == RETRY_AFTER_ATTEMPTS:
+                        raise
+                    self.retries += 1
+                    logging.warning("Telegram просит подождать %s с (%s, чат %s)", e.timeout, method, chat_id)
+                    # Ожидание может относиться ко всему боту, а не только к этому чату
+                    if chat_bucket is not None:
+                        chat_bucket.pause(e.timeout)
+                    self.global_bucket.pause(e.timeout)
+        finally:
+            if edit_key is not None and self._latest_edits.get(edit_key) is data:
+                del self._latest_edits[edit_key]
+
+    # Удаление сообщения в фоне без ожидания результата; ошибки (сообщение уже удалено и т.п.) игнорируются
+    def delete_later(self, chat_id, message_id):
+        task = asyncio.create_task(self._delete_quietly(chat_id, message_id))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _delete_quietly(self, chat_id, message_id):
+        try:
+            await self.delete_message(chat_id=chat_id, message_id=message_id)
+        except TelegramAPIError:
+            pass
+
+    def stats(self):
+        return {"chats": len(self.chat_buckets), "retries": self.retries, "merged_edits": self.merged_edits,
+                "background": len(self._background)}
@@ -0,0 +1,190 @@
+import asyncio
+import re
+import time
+
+from data import backends
+from data.cache import LRUCache, MISSING
+from data.config import (TRANSLATE_BACKEND, TRANSLATE_CACHE_SIZE, TRANSLATE_PERSIST,
+                         TRANSLATE_BATCH_DELAY, TRANSLATE_BATCH_SIZE, TRANSLATE_BATCH_CHARS)
+from data.database.connection import db
+from data.workers import translate_workers, run_user_job
+
+SENTENCE_END = re.compile(r'(?<=[.!?…])\s+')
+
+
+# Перевод через Google Translate (googletrans); библиотека загружается при первом переводе.
+# googletrans переводит список строк по одной строке за запрос, поэтому пачка отправляется одним текстом
+# с предложениями на отдельных строках (внутри предложений переводов строк нет, см. split_sentences).
+class GoogleBackend:
+    SEPARATOR = "\n"
+
+    def __init__(self):
+        self._translator = None
+        self.requests = 0
+
+    @property
+    def translator(self):
+        if self._translator is None:
+            self._translator = backends.get("googletrans").Translator()
+        return self._translator
+
+    def _translate(self, text, src, dest):
+        self.requests += 1
+        return self.translator.translate(text, src=src, dest=dest).text
+
+    def translate_batch(self, texts, src, dest):
+        if len(texts) == 1:
+            return [self._translate(texts[0], src, dest)]
+        results = self._translate(self.SEPARATOR.join(texts), src, dest).split(self.SEPARATOR)
+        if len(results) == len(texts):
+            return [result.strip() for result in results]
+        # Переводчик объединил или разбил строки — переводим предложения по отдельности
+        return [self._translate(text, src, dest) for text in texts]
+
+
+# Локальный переводчик-заглушка для тестов и бенчмарков без доступа к сети
+class StubBackend:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.requests = 0
+
+    def translate_batch(self, texts, src, dest):
+        self.requests += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return [f"[{dest}] {text}" for text in texts]
+
+
+BACKENDS = {"google": GoogleBackend, "stub": StubBackend}
+
+
+# Разбиение строки на предложения с приведением пробелов к единому виду
+def split_sentences(line):
+    return [" ".join(chunk.split()) for chunk in SENTENCE_END.split(line.strip()) if chunk.strip()]
+
+
+# Переводчик с кэшем по предложениям и объединением одновременных запросов в пачки.
+# Текст делится на предложения, переводятся только те, которых ещё нет в кэше;
+# предложения из разных одновременных запросов отправляются переводчику вместе, пачками ограниченного размера.
+class TranslationEngine:
+    def __init__(self, backend, cache_size=10000, persist=False, batch_delay=0.05, batch_size=50,
+                 batch_chars=4500):
+        self.backend = backend
+        self.cache = LRUCache(cache_size)
+        self.persist = persist
+        self.batch_delay = batch_delay
+        self.batch_size = batch_size
+        self.batch_chars = batch_chars
+        self._pending = {}
+        self._flush_handles = {}
+
+    async def _load_persisted(self, chunks, src, dest):
+        placeholders = ", ".join("?" * len(chunks))
+        rows = await db.fetchall(f'SELECT text, result FROM translations '
+                                 f'WHERE src=? AND dest=? AND text IN ({placeholders})',
+                                 [src, dest, *chunks])
+        for text, result in rows:
+            self.cache.set((src, dest, text), result)
+        return dict(rows)
+
+    def _request(self, chunk, src, dest):
+        pair = (src, dest)
+        pending = self._pending.setdefault(pair, {})
+        future = pending.get(chunk)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            pending[chunk] = future
+        if len(pending) >= self.batch_size:
+            self._schedule_flush(pair, 0)
+        else:
+            self._schedule_flush(pair, self.batch_delay)
+        return future
+
+    def _schedule_flush(self, pair, delay):
+        handle = self._flush_handles.get(pair)
+        if handle is not None:
+            if delay > 0:
+                return
+            handle.cancel()
+        loop = asyncio.get_running_loop()
+        self._flush_handles[pair] = loop.call_later(delay, lambda: asyncio.ensure_future(self._flush(pair)))
+
+    # Разбиение ожидающих предложений на пачки не больше batch_size предложений и batch_chars символов
+    def _batches(self, chunks):
+        batch, size = [], 0
+        for chunk in chunks:
+            if batch and (len(batch) >= self.batch_size or size + len(chunk) + 1 > self.batch_chars):
+                yield batch
+                batch, size = [], 0
+            batch.append(chunk)
+            size += len(chunk) + 1
+        if batch:
+            yield batch
+
+    async def _flush(self, pair):
+        self._flush_handles.pop(pair, None)
+        pending = self._pending.pop(pair, {})
+        if pending:
+            await asyncio.gather(*(self._translate_batch(batch, pending, pair) for batch in self._batches(pending)))
+
+    # Перевод одной пачки; ошибку получают только запросы, предложения которых были в этой пачке
+    async def _translate_batch(self, chunks, pending, pair):
+        src, dest = pair
+        try:
+            results = await translate_workers.run(self.backend.translate_batch, chunks, src, dest)
+        except Exception as e:
+            for chunk in chunks:
+                if not pending[chunk].done():
+                    pending[chunk].set_exception(e)
+            return
+
+        for chunk, result in zip(chunks, results):
+            self.cache.set((src, dest, chunk), result)
+            if not pending[chunk].done():
+                pending[chunk].set_result(result)
+        if self.persist:
+            await db.executemany('INSERT OR REPLACE INTO translations (src, dest, text, result) VALUES (?, ?, ?, ?)',
+                                 [(src, dest, chunk, result) for chunk, result in zip(chunks, results)])
+
+    async def _translate_chunks(self, chunks, src, dest):
+        translated = {}
+        missing = []
+        for chunk in dict.fromkeys(chunks):
+            result = self.cache.get((src, dest, chunk))
+            if result is MISSING:
+                missing.append(chunk)
+            else:
+                translated[chunk] = result
+
+        if missing and self.persist:
+            translated.update(await self._load_persisted(missing, src, dest))
+            missing = [chunk for chunk in missing if chunk not in translated]
+
+        if missing:
+            futures = [self._request(chunk, src, dest) for chunk in missing]
+            results = await asyncio.gather(*(asyncio.shield(future) for future in futures))
+            translated.update(zip(missing, results))
+        return translated
+
+    # Перевод текста с сохранением разбиения на строки
+    async def translate(self, text, src, dest, user_id=None):
+        if src == dest:
+            return text
+        lines = [split_sentences(line) for line in text.split("\n")]
+        chunks = [chunk for line in lines for chunk in line]
+        if not chunks:
+            return text
+
+        job = self._translate_chunks(chunks, src, dest)
+        translated = await (job if user_id is None else run_user_job(job, user_id, "translate"))
+        return "\n".join(" ".join(translated[chunk] for chunk in line) for line in lines)
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats["upstream_calls"] = self.backend.requests
+        return stats
+
+
+translation_engine = TranslationEngine(BACKENDS[TRANSLATE_BACKEND](), cache_size=TRANSLATE_CACHE_SIZE,
+                                       persist=TRANSLATE_PERSIST, batch_delay=TRANSLATE_BATCH_DELAY,
+                                       batch_size=TRANSLATE_BATCH_SIZE, batch_chars=TRANSLATE_BATCH_CHARS)
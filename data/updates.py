@@ -0,0 +1,192 @@
+import asyncio
+import contextvars
+import functools
+import logging
+from collections import deque
+
+from aiogram import Bot, Dispatcher, types
+from aiohttp import web
+
+from data.metrics import register_stats
+from data.config import (BOT_MODE, UPDATE_WORKERS, UPDATE_QUEUE_SIZE, PENDING_UPDATES, POLLING_TIMEOUT,
+                         WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_SECRET)
+
+
+# Чат (или пользователь), к которому относится обновление; обновления одного чата обрабатываются по порядку
+def update_chat_key(update: types.Update):
+    for event in (update.message, update.edited_message, update.channel_post, update.edited_channel_post):
+        if event is not None:
+            return event.chat.id
+    if update.callback_query is not None:
+        if update.callback_query.message is not None:
+            return update.callback_query.message.chat.id
+        return update.callback_query.from_user.id
+    for event in (update.inline_query, update.chosen_inline_result, update.my_chat_member, update.chat_member,
+                  update.chat_join_request, update.shipping_query, update.pre_checkout_query):
+        if event is not None:
+            return event.from_user.id
+    return update.update_id
+
+# Событие, которое обработчик устанавливает, чтобы отпустить свой чат (см. release_chat)
+_chat_release = contextvars.ContextVar("chat_release", default=None)
+
+
+# Следующие обновления чата можно обрабатывать, не дожидаясь окончания текущего обработчика.
+# Вызывается перед долгим ожиданием (OCR, поиск), чтобы новое сообщение пользователя могло его заменить или отменить.
+def release_chat():
+    released = _chat_release.get()
+    if released is not None:
+        released.set()
+
+
+# Очередь обновлений с несколькими обработчиками.
+# Разные чаты обрабатываются параллельно, обновления одного чата — строго по порядку,
+# чтобы состояние FSM пользователя оставалось согласованным (пока обработчик не вызовет release_chat).
+# Общее количество ожидающих обновлений ограничено: если обработчики заняты (OCR, поиск, ГДЗ),
+# put ждёт, и приём новых обновлений замедляется.
+class UpdateQueue:
+    def __init__(self, dispatcher: Dispatcher, workers=8, maxsize=200):
+        self.dispatcher = dispatcher
+        self.workers = workers
+        self.maxsize = maxsize
+        self._chats = {}
+        self._ready = asyncio.Queue()
+        self._slots = asyncio.Semaphore(maxsize)
+        self._tasks = []
+        self._running = set()
+        self.pending = 0
+        self.processed = 0
+
+    async def put(self, update: types.Update):
+        await self._slots.acquire()
+        self.pending += 1
+        key = update_chat_key(update)
+        chat_updates = self._chats.get(key)
+        if chat_updates is None:
+            self._chats[key] = deque([update])
+            self._ready.put_nowait(key)
+        else:
+            chat_updates.append(update)
+
+    async def _worker(self):
+        while True:
+            key = await self._ready.get()
+            chat_updates = self._chats[key]
+            while chat_updates:
+                update = chat_updates.popleft()
+                released = asyncio.Event()
+                token = _chat_release.set(released)
+                try:
+                    # Отдельная задача — отдельный контекст: aiogram кэширует состояние FSM в contextvars
+                    task = asyncio.create_task(self.dispatcher.process_update(update))
+                finally:
+                    _chat_release.reset(token)
+                self._running.add(task)
+                task.add_done_callback(functools.partial(self._done, update))
+                release = asyncio.ensure_future(released.wait())
+                try:
+                    await asyncio.wait((task, release), return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    release.cancel()
+            del self._chats[key]
+
+    def _done(self, update, task):
+        self._running.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logging.error("Ошибка при обработке обновления %s", update.update_id, exc_info=task.exception())
+        self.pending -= 1
+        self.processed += 1
+        self._slots.release()
+
+    def start(self):
+        Bot.set_current(self.dispatcher.bot)
+        Dispatcher.set_current(self.dispatcher)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    # Ожидание обработки уже принятых обновлений и остановка обработчиков
+    async def stop(self, timeout=10):
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning("Не обработано обновлений при остановке: %s", self.pending)
+        tasks = self._tasks + list(self._running)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _drain(self):
+        while self.pending:
+            await asyncio.sleep(0.1)
+
+    def stats(self):
+        return {"workers": self.workers, "pending": self.pending, "chats": len(self._chats),
+                "running": len(self._running), "processed": self.processed}
+
+
+async def _poll(bot: Bot, queue: UpdateQueue):
+    await bot.delete_webhook(drop_pending_updates=PENDING_UPDATES == "drop")
+    offset = None
+    while True:
+        try:
+            with bot.request_timeout(POLLING_TIMEOUT + 5):
+                updates = await bot.get_updates(offset=offset, timeout=POLLING_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logging.exception("Ошибка при получении обновлений")
+            await asyncio.sleep(5)
+            continue
+        for update in updates:
+            await queue.put(update)
+            offset = update.update_id + 1
+
+
+async def _serve_webhook(bot: Bot, queue: UpdateQueue):
+    async def handle(request: web.Request):
+        if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            return web.Response(status=403)
+        update = types.Update(**await request.json())
+        await queue.put(update)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(WEBHOOK_PATH, handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT).start()
+    await bot.set_webhook(WEBHOOK_URL + WEBHOOK_PATH, drop_pending_updates=PENDING_UPDATES == "drop",
+                          secret_token=WEBHOOK_SECRET or None)
+    logging.info("Вебхук запущен на %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
+async def _run(dispatcher: Dispatcher, on_startup, on_shutdown):
+    queue = UpdateQueue(dispatcher, workers=UPDATE_WORKERS, maxsize=UPDATE_QUEUE_SIZE)
+    register_stats("updates", queue.stats)
+    queue.start()
+    try:
+        if on_startup is not None:
+            await on_startup(dispatcher)
+        if BOT_MODE == "webhook":
+            await _serve_webhook(dispatcher.bot, queue)
+        else:
+            await _poll(dispatcher.bot, queue)
+    finally:
+        await queue.stop()
+        if on_shutdown is not None:
+            await on_shutdown(dispatcher)
+        await dispatcher.storage.close()
+        await dispatcher.storage.wait_closed()
+        await (await dispatcher.bot.get_session()).close()
+
+
+# Запуск бота в режиме BOT_MODE ("polling" или "webhook")
+def start(dispatcher: Dispatcher, on_startup=None, on_shutdown=None):
+    try:
+        asyncio.run(_run(dispatcher, on_startup, on_shutdown))
+    except KeyboardInterrupt:
+        pass
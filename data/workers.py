@@ -0,0 +1,171 @@
+import asyncio
+import functools
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from data.config import (OCR_PROCESSES, OCR_TIMEOUT, NETWORK_THREADS,
+                         SEARCH_CONCURRENCY, SEARCH_TIMEOUT,
+                         TRANSLATE_CONCURRENCY, TRANSLATE_TIMEOUT)
+
+
+# Задача пользователя была отменена командой /cancel
+class JobCancelled(Exception):
+    pass
+
+
+# Задачи, выполняющиеся сейчас для каждого пользователя (для отмены по /cancel)
+_user_jobs = {}
+
+
+# Группа однотипных задач со своим исполнителем, лимитом параллельности и таймаутом.
+# Блокирующая работа выполняется в пуле потоков или процессов, а цикл событий бота остаётся свободным.
+class WorkerPool:
+    def __init__(self, name, executor_factory, limit, timeout):
+        self.name = name
+        self.limit = limit
+        self.timeout = timeout
+        self._executor_factory = executor_factory
+        self._executor = None
+        self._semaphore = None
+        self.active = 0
+        self.waiting = 0
+        self.requests = 0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = self._executor_factory()
+        return self._executor
+
+    @property
+    def semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        return self._semaphore
+
+    # Место в пуле освобождается, только когда блокирующая функция действительно закончилась:
+    # после таймаута или отмены она продолжает выполняться в потоке или процессе.
+    async def _run(self, func, args):
+        self.waiting += 1
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        loop = asyncio.get_running_loop()
+        try:
+            future = self.executor.submit(func, *args)
+        except BaseException:
+            self.semaphore.release()
+            raise
+        self.active += 1
+        future.add_done_callback(functools.partial(self._done_threadsafe, loop, time.perf_counter()))
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.CancelledError:
+            # Задача, ещё не начатая в пуле, снимается с очереди; начатую прервать нельзя,
+            # поэтому отмена заканчивается вместе с ней, и вызывающий знает, когда пул освободился
+            if not future.done():
+                await asyncio.wait((asyncio.wrap_future(future),))
+            raise
+
+    def _done_threadsafe(self, loop, started, future):
+        try:
+            loop.call_soon_threadsafe(self._done, started, future)
+        except RuntimeError:
+            pass  # Цикл событий уже закрыт при остановке бота
+
+    def _done(self, started, future):
+        self.active -= 1
+        self.semaphore.release()
+        if not future.cancelled():
+            self.requests += 1
+            self.last_latency = time.perf_counter() - started
+            self.total_latency += self.last_latency
+
+    # Выполнение блокирующей функции в пуле.
+    # Если передан user_id, задачу можно отменить через cancel_user_jobs.
+    async def run(self, func, *args, user_id=None):
+        if user_id is None:
+            return await self._run(func, args)
+        return await run_user_job(self._run(func, args), user_id, self.name)
+
+    # Очередь и время выполнения задач (без ожидания в очереди)
+    def stats(self):
+        return {"limit": self.limit, "active": self.active, "waiting": self.waiting, "requests": self.requests,
+                "avg_latency": self.total_latency / self.requests if self.requests else 0.0,
+                "last_latency": self.last_latency}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Ожидание задачи пользователя с возможностью отменить её через cancel_user_jobs
+async def run_user_job(awaitable, user_id, name="job"):
+    task = asyncio.ensure_future(awaitable)
+    _user_jobs.setdefault(user_id, set()).add(task)
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        if task.cancelled():
+            raise JobCancelled(name)
+        task.cancel()
+        raise
+    finally:
+        jobs = _user_jobs.get(user_id)
+        if jobs is not None:
+            jobs.discard(task)
+            if not jobs:
+                del _user_jobs[user_id]
+
+
+# Отмена всех выполняющихся задач пользователя
+def cancel_user_jobs(user_id):
+    jobs = _user_jobs.pop(user_id, set())
+    for task in jobs:
+        task.cancel()
+    return len(jobs)
+
+
+def _ocr_process_pool():
+    from data.ocr import init_ocr_process
+    return ProcessPoolExecutor(max_workers=OCR_PROCESSES, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=init_ocr_process)
+
+
+_network_executor = None
+
+
+# Общий пул потоков для сетевых запросов
+def _network_thread_pool():
+    global _network_executor
+    if _network_executor is None:
+        _network_executor = ThreadPoolExecutor(max_workers=NETWORK_THREADS, thread_name_prefix="network")
+    return _network_executor
+
+
+ocr_workers = WorkerPool("ocr", _ocr_process_pool, OCR_PROCESSES, OCR_TIMEOUT)
+search_workers = WorkerPool("search", _network_thread_pool, SEARCH_CONCURRENCY, SEARCH_TIMEOUT)
+translate_workers = WorkerPool("translate", _network_thread_pool, TRANSLATE_CONCURRENCY, TRANSLATE_TIMEOUT)
+
+worker_pools = [ocr_workers, search_workers, translate_workers]
+
+
+# Запуск процессов OCR заранее, чтобы первая фотография не ждала загрузки моделей
+async def warm_up_workers():
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*(loop.run_in_executor(ocr_workers.executor, os.getpid) for _ in range(OCR_PROCESSES)))
+    logging.info("Процессы OCR запущены: %s", OCR_PROCESSES)
+
+
+def shutdown_workers():
+    global _network_executor
+    for pool in worker_pools:
+        pool.shutdown()
+    _network_executor = None